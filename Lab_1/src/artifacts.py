@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable
+
+
+# ========== Фоновая запись артефактов ==========
+# PNG (сжатие zlib), гистограммы и JSON пишутся в пуле потоков, пока
+# основной поток шифрует следующий буфер. Сжатие в Pillow и zlib отпускает
+# GIL, поэтому потоки действительно работают параллельно.
+# Число задач в очереди ограничено (max_pending): submit() блокируется,
+# пока место не освободится, и память под ожидающие буферы не растёт.
+# Первая ошибка записи пробрасывается из следующего submit() или flush().
+
+class ArtifactWriter:
+    """Пул потоков для записи файлов с обратным давлением.
+
+    workers=0 - синхронный режим: submit() сразу вызывает функцию.
+    Передаваемые аргументы не должны меняться после submit().
+    """
+
+    def __init__(self, workers: int = 2, max_pending: int | None = None) -> None:
+        self.workers = workers
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix="artifact") if workers > 0 else None
+        self._slots = threading.BoundedSemaphore(max_pending or 4 * max(workers, 1))
+        self._lock = threading.Lock()
+        self._pending: set[Future] = set()
+        self._error: BaseException | None = None
+
+    def submit(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Future | None:
+        """Поставить fn(*args, **kwargs) в очередь; в синхронном режиме - None."""
+        self._raise_error()
+        if self._pool is None:
+            fn(*args, **kwargs)
+            return None
+
+        self._slots.acquire()
+        try:
+            fut = self._pool.submit(fn, *args, **kwargs)
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._pending.add(fut)
+        fut.add_done_callback(self._done)
+        return fut
+
+    def flush(self) -> None:
+        """Дождаться всех поставленных задач; поднять первую ошибку."""
+        while True:
+            with self._lock:
+                pending = list(self._pending)
+            if not pending:
+                break
+            for fut in pending:
+                fut.exception()
+        self._raise_error()
+
+    def close(self) -> None:
+        try:
+            self.flush()
+        finally:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True)
+
+    def __enter__(self) -> "ArtifactWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+            return
+        # Уже летит исключение: дожидаемся записи, но не подменяем его
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+
+    def _done(self, fut: Future) -> None:
+        with self._lock:
+            self._pending.discard(fut)
+            if self._error is None and not fut.cancelled() and fut.exception() is not None:
+                self._error = fut.exception()
+        self._slots.release()
+
+    def _raise_error(self) -> None:
+        with self._lock:
+            error, self._error = self._error, None
+        if error is not None:
+            raise RuntimeError(f"artifact write failed: {error}") from error
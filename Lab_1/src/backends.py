@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+from typing import Callable
+
+from encryptors import *
+
+
+# ========== Таблица шифров ==========
+# Каждый алгоритм описывается одной записью CipherBackend. Конвейер
+# (pipeline.py) и CLI (--algo) берут список алгоритмов только отсюда,
+# поэтому новый шифр добавляется одним вызовом register_backend().
+
+@dataclass(frozen=True)
+class CipherBackend:
+    name: str                 # имя для --algo и в именах файлов
+    label: str                # имя для вывода в консоль и подписей
+    nonce_size: int           # длина IV/nonce в байтах, 0 - не нужен
+    nonce_field: str | None   # ключ в summary для IV/nonce ("iv_hex", "nonce_hex")
+    # encrypt(data, key, nonce, workers, output) / decrypt(...) -> bytes
+    encrypt: Callable
+    decrypt: Callable
+    # Для AEAD-шифров: длина тега и функции с тегом
+    # encrypt_and_digest(data, key, nonce, workers, output) -> (enc, tag)
+    # decrypt_and_verify(enc, key, nonce, tag, workers, output) -> bytes
+    # (encrypt/decrypt у них работают без тега - для метрик и замеров)
+    tag_size: int = 0
+    encrypt_and_digest: Callable | None = None
+    decrypt_and_verify: Callable | None = None
+    # Расшифрование участка: decrypt_range(enc, key, nonce, start, stop) -> bytes,
+    # start/stop кратны block_size (выборочная проверка обратимости)
+    block_size: int = 1
+    decrypt_range: Callable | None = None
+
+    def new_nonce(self) -> bytes | None:
+        if not self.nonce_size:
+            return None
+        return os.urandom(self.nonce_size)
+
+
+BACKENDS: dict[str, CipherBackend] = {}
+
+
+def register_backend(backend: CipherBackend) -> CipherBackend:
+    BACKENDS[backend.name] = backend
+    return backend
+
+
+def get_backend(name: str) -> CipherBackend:
+    try:
+        return BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown algo: {name}") from None
+
+
+# ---------- Обёртки к единой сигнатуре ----------
+
+def _xor_enc(data, key, nonce, workers=1, output=None):
+    return xor_stream_encrypt(data, key, nonce, workers, output)
+
+
+def _xor_dec(data, key, nonce, workers=1, output=None):
+    return xor_stream_decrypt(data, key, nonce, workers, output)
+
+
+def _ecb_enc(data, key, nonce, workers=1, output=None):
+    return aes_ecb_encrypt(data, key, workers, output)
+
+
+def _ecb_dec(data, key, nonce, workers=1, output=None):
+    return aes_ecb_decrypt(data, key, workers, output)
+
+
+def _cbc_enc(data, key, nonce, workers=1, output=None):
+    # Шифрование CBC последовательно, workers не используется
+    return aes_cbc_encrypt(data, key, nonce, output)
+
+
+def _cbc_dec(data, key, nonce, workers=1, output=None):
+    return aes_cbc_decrypt(data, key, nonce, workers, output)
+
+
+def _ctr_enc(data, key, nonce, workers=1, output=None):
+    return aes_ctr_encrypt(data, key, nonce, workers, output)
+
+
+def _ctr_dec(data, key, nonce, workers=1, output=None):
+    return aes_ctr_decrypt(data, key, nonce, workers, output)
+
+
+def _chacha_enc(data, key, nonce, workers=1, output=None):
+    return chacha20_encrypt(data, key, nonce, workers, output)
+
+
+def _chacha_dec(data, key, nonce, workers=1, output=None):
+    return chacha20_decrypt(data, key, nonce, workers, output)
+
+
+def _gcm_seal(data, key, nonce, workers=1, output=None):
+    return aes_gcm_encrypt(data, key, nonce, output)
+
+
+def _gcm_open(data, key, nonce, tag, workers=1, output=None):
+    return aes_gcm_decrypt(data, key, nonce, tag, output)
+
+
+def _gcm_enc(data, key, nonce, workers=1, output=None):
+    return aes_gcm_encrypt(data, key, nonce, output)[0]
+
+
+def _gcm_dec(data, key, nonce, workers=1, output=None):
+    return aes_gcm_decrypt(data, key, nonce, None, output)
+
+
+def _ecb_range(data, key, nonce, start, stop):
+    return aes_ecb_decrypt_range(data, key, start, stop)
+
+
+register_backend(CipherBackend(
+    "xor", "XOR", 16, "iv_hex", _xor_enc, _xor_dec,
+    decrypt_range=xor_decrypt_range,
+))
+register_backend(CipherBackend(
+    "aes-ecb", "AES-ECB", 0, None, _ecb_enc, _ecb_dec,
+    block_size=16, decrypt_range=_ecb_range,
+))
+register_backend(CipherBackend(
+    "aes-cbc", "AES-CBC", 16, "iv_hex", _cbc_enc, _cbc_dec,
+    block_size=16, decrypt_range=aes_cbc_decrypt_range,
+))
+register_backend(CipherBackend(
+    "aes-ctr", "AES-CTR", 8, "nonce_hex", _ctr_enc, _ctr_dec,
+    block_size=16, decrypt_range=aes_ctr_decrypt_range,
+))
+register_backend(CipherBackend(
+    "chacha20", "ChaCha20", 12, "nonce_hex", _chacha_enc, _chacha_dec,
+    decrypt_range=chacha20_decrypt_range,
+))
+register_backend(CipherBackend(
+    "aes-gcm", "AES-GCM", 12, "nonce_hex", _gcm_enc, _gcm_dec,
+    tag_size=16, encrypt_and_digest=_gcm_seal, decrypt_and_verify=_gcm_open,
+    block_size=16, decrypt_range=aes_gcm_decrypt_range,
+))
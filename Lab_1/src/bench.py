@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import json
+import os
+import platform
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+from backends import BACKENDS
+from encryptors import (
+    derive_stream_seed,
+    keystream_xorshift_scalar,
+    set_keystream_cache_limit,
+    xor_stream,
+)
+from stages import current_rss_mb
+from utils import load_image
+
+
+# ================== Вспомогательное ==================
+
+def _parse_size(text: str) -> int:
+    text = text.strip().upper()
+    mult = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+    if text and text[-1] in mult:
+        return int(float(text[:-1]) * mult[text[-1]])
+    return int(text)
+
+
+def _peak_alloc_mb(fn, data) -> float:
+    # Отдельный вызов под tracemalloc (замеры времени идут без него): пик
+    # выделенной памяти именно этого случая, а не всего процесса с начала
+    # прогона. Память процессов пула (--workers > 1) сюда не попадает.
+    tracemalloc.start()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        fn(data)
+        return (tracemalloc.get_traced_memory()[1] - base) / (1 << 20)
+    finally:
+        tracemalloc.stop()
+
+
+def _percentile(sorted_vals: list[float], q: float) -> float:
+    if len(sorted_vals) == 1:
+        return sorted_vals[0]
+    pos = (len(sorted_vals) - 1) * q
+    lo = int(pos)
+    hi = min(lo + 1, len(sorted_vals) - 1)
+    return sorted_vals[lo] + (sorted_vals[hi] - sorted_vals[lo]) * (pos - lo)
+
+
+def _measure(fn, data, repeat: int) -> dict:
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(data)
+        times.append(time.perf_counter() - t0)
+    times.sort()
+    n = memoryview(data).nbytes
+    ms = [t * 1000.0 for t in times]
+    return {
+        "size": n,
+        "repeat": repeat,
+        "mb_s": n / (1 << 20) / _percentile(times, 0.5),
+        "latency_ms": {
+            "min": ms[0],
+            "p50": _percentile(ms, 0.5),
+            "p90": _percentile(ms, 0.9),
+            "p99": _percentile(ms, 0.99),
+            "max": ms[-1],
+        },
+        "peak_alloc_mb": _peak_alloc_mb(fn, data),
+        # Текущий RSS после замера (ru_maxrss не убывает и для случаев не годится)
+        "rss_mb": current_rss_mb(),
+    }
+
+
+def _case_id(row: dict) -> str:
+    return f"{row['algo']}:{row['op']}@{row['input']}"
+
+
+# ================== Набор замеров ==================
+
+def _cases(data: bytes, key: bytes, workers: int):
+    # (algo, op, fn, вход fn) для всех шифров из таблицы BACKENDS
+    for backend in BACKENDS.values():
+        nonce = backend.new_nonce()
+        enc = backend.encrypt(data, key, nonce, workers)
+        yield backend.name, "enc", lambda d, b=backend, n=nonce: b.encrypt(d, key, n, workers), data
+        yield backend.name, "dec", lambda d, b=backend, n=nonce: b.decrypt(d, key, n, workers), enc
+
+
+def run_suite(
+    sizes: list[int],
+    imgs_dir: str | None,
+    repeat: int,
+    workers: int,
+    use_cache: bool = False,
+) -> dict:
+    # С кэшем повторные XOR-замеры мерили бы только XOR буферов
+    if not use_cache:
+        set_keystream_cache_limit(0)
+    key = os.urandom(16)
+
+    def inputs():
+        # Буферы создаются по одному, чтобы не держать 1 ГБ + 256 МБ сразу
+        for n in sizes:
+            n -= n % 16  # ECB/CBC требуют кратности блоку
+            yield f"synthetic:{n}", np.random.bytes(n)
+        if imgs_dir:
+            for p in sorted(Path(imgs_dir).glob("*.png")):
+                rgb, _w, _h = load_image(str(p))
+                yield str(p), rgb
+
+    rows = []
+    for name, data in inputs():
+        if len(data) % 16 != 0:
+            print(f"[WARN] {name}: размер не кратен 16 байтам, пропуск")
+            continue
+        for algo, op, fn, buf in _cases(data, key, workers):
+            row = {"algo": algo, "op": op, "input": name}
+            row.update(_measure(fn, buf, repeat))
+            rows.append(row)
+            print(
+                f"{_case_id(row):48s} {row['mb_s']:10.2f} MB/s"
+                f"  p50={row['latency_ms']['p50']:9.2f} ms"
+            )
+
+    return {
+        "meta": {
+            "date": dt.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "workers": workers,
+            "repeat": repeat,
+            "keystream_cache": use_cache,
+        },
+        "results": rows,
+    }
+
+
+def compare(baseline: dict, current: dict, threshold_pct: float) -> list[dict]:
+    """Случаи, где MB/s упали больше чем на threshold_pct процентов."""
+    base = {_case_id(r): r for r in baseline["results"]}
+    regressions = []
+    for row in current["results"]:
+        old = base.get(_case_id(row))
+        if old is None:
+            continue
+        change = (row["mb_s"] - old["mb_s"]) / old["mb_s"] * 100.0
+        if change < -threshold_pct:
+            regressions.append({
+                "case": _case_id(row),
+                "baseline_mb_s": old["mb_s"],
+                "current_mb_s": row["mb_s"],
+                "change_pct": change,
+            })
+    return regressions
+
+
+def _report_regressions(regressions: list[dict], threshold_pct: float) -> int:
+    if not regressions:
+        print(f"[OK] регрессий больше {threshold_pct:g}% нет")
+        return 0
+    for r in regressions:
+        print(
+            f"[REGRESSION] {r['case']}: {r['baseline_mb_s']:.2f} -> "
+            f"{r['current_mb_s']:.2f} MB/s ({r['change_pct']:+.1f}%)"
+        )
+    return 1
+
+
+# ================== XOR: скалярный поток против векторного ==================
+
+def _xor_stream_scalar(data: bytes, key: bytes, iv: bytes) -> bytes:
+    # Исходная реализация: генератор по байту + XOR через zip
+    ks = keystream_xorshift_scalar(derive_stream_seed(key, iv), len(data))
+    return bytes(a ^ b for a, b in zip(data, ks))
+
+
+def _mb_per_s(fn, data: bytes, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(data)
+        best = min(best, time.perf_counter() - t0)
+    return len(data) / (1 << 20) / best
+
+
+def bench_xor(size_mb: float, repeat: int, scalar_mb: float, workers: int = 1) -> None:
+    key = os.urandom(16)
+    iv = os.urandom(16)
+
+    # Скалярная версия очень медленная, поэтому меряем её на меньшем буфере
+    data_scalar = os.urandom(int(scalar_mb * (1 << 20)))
+    data_bulk = os.urandom(int(size_mb * (1 << 20)))
+
+    before = _mb_per_s(lambda d: _xor_stream_scalar(d, key, iv), data_scalar, 1)
+    set_keystream_cache_limit(0)
+    after = _mb_per_s(lambda d: xor_stream(d, key, iv, workers), data_bulk, repeat)
+
+    print(f"xor_stream (scalar, {scalar_mb:g} MB): {before:10.2f} MB/s")
+    print(f"xor_stream (bulk,   {size_mb:g} MB, workers={workers}): {after:10.2f} MB/s")
+    print(f"speedup: x{after / before:.1f}")
+
+
+# ================== CLI ==================
+
+def main():
+    ap = argparse.ArgumentParser(description="Замеры скорости шифров Lab_1")
+    sub = ap.add_subparsers(dest="mode", required=True)
+
+    ap_suite = sub.add_parser("suite", help="все шифры на синтетических буферах и imgs/")
+    ap_suite.add_argument(
+        "--sizes",
+        default="64K,1M,16M,256M,1G",
+        help="размеры синтетических буферов через запятую (K/M/G)",
+    )
+    ap_suite.add_argument("--imgs-dir", default="imgs", help="каталог с PNG ('' - без изображений)")
+    ap_suite.add_argument("--repeat", type=int, default=5, help="число повторов каждого замера")
+    ap_suite.add_argument("--workers", type=int, default=1, help="число потоков/процессов шифров")
+    ap_suite.add_argument("--with-cache", action="store_true", help="не отключать кэш ключевых потоков")
+    ap_suite.add_argument("--out", default="results/bench.json", help="JSON с результатами")
+    ap_suite.add_argument("--baseline", help="JSON прошлого прогона для сравнения")
+    ap_suite.add_argument("--threshold", type=float, default=10.0, help="допустимое падение MB/s, %%")
+
+    ap_cmp = sub.add_parser("compare", help="сравнить два JSON-результата")
+    ap_cmp.add_argument("baseline", help="JSON базового прогона")
+    ap_cmp.add_argument("current", help="JSON текущего прогона")
+    ap_cmp.add_argument("--threshold", type=float, default=10.0, help="допустимое падение MB/s, %%")
+
+    ap_xor = sub.add_parser("xor", help="XOR: скалярная генерация потока против векторной")
+    ap_xor.add_argument("--size-mb", type=float, default=64.0, help="размер буфера для bulk-версии")
+    ap_xor.add_argument("--scalar-mb", type=float, default=2.0, help="размер буфера для скалярной версии")
+    ap_xor.add_argument("--repeat", type=int, default=3, help="число повторов (берётся лучший)")
+    ap_xor.add_argument("--workers", type=int, default=1, help="число процессов для xor_stream")
+
+    args = ap.parse_args()
+
+    if args.mode == "suite":
+        sizes = [_parse_size(s) for s in args.sizes.split(",") if s.strip()]
+        report = run_suite(sizes, args.imgs_dir or None, args.repeat, args.workers, args.with_cache)
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.out).write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"[OK] bench: {args.out}")
+        if args.baseline:
+            baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+            raise SystemExit(_report_regressions(compare(baseline, report, args.threshold), args.threshold))
+    elif args.mode == "compare":
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        current = json.loads(Path(args.current).read_text(encoding="utf-8"))
+        raise SystemExit(_report_regressions(compare(baseline, current, args.threshold), args.threshold))
+    elif args.mode == "xor":
+        bench_xor(args.size_mb, args.repeat, args.scalar_mb, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,9 +2,20 @@
 from __future__ import annotations
 
 import hashlib
-from Crypto.Cipher import AES
+import math
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+from Crypto.Cipher import AES, ChaCha20
 from Crypto.Util import Counter
 
+from contextlib import contextmanager
+
+from cache import LRUCache
+from mapped import mapped_ref, open_ref, sub_ref
+
 
 def _sha256(data: bytes) -> bytes:
     return hashlib.sha256(data).digest()
@@ -31,8 +42,60 @@ class XorShift32:
     def next_byte(self) -> int:
         return self.next_u32() & 0xFF
 
+    def jump(self, n_steps: int) -> None:
+        """Продвигает состояние на n_steps шагов за O(log n_steps)."""
+        if n_steps < 0:
+            raise ValueError(f"XorShift32.jump: n_steps must be >= 0, got {n_steps}")
+        self.state = _xorshift_jump(self.state, n_steps)
+
+
+# ---------- Кэши ключевых потоков и контекстов AES ----------
+# Ключ кэша содержит sha256(key), а не сам ключ.
+
+KEYSTREAM_CACHE = LRUCache(256 << 20, sizeof=lambda ks: ks.nbytes, name="keystream")
+AES_CONTEXT_CACHE = LRUCache(64, sizeof=lambda _ctx: 1, name="aes_context")
+
+
+def set_keystream_cache_limit(max_bytes: int) -> None:
+    KEYSTREAM_CACHE.resize(max_bytes)
+
+
+_BYPASS = threading.local()
+
 
-def _derive_stream_seed(key: bytes, iv: bytes) -> int:
+@contextmanager
+def keystream_cache_bypass():
+    """Шифрование внутри блока не читает и не пополняет KEYSTREAM_CACHE.
+
+    Для одноразовых ключей (изменённый бит ключа в проверке
+    чувствительности): их поток больше не понадобится, а в кэше он вытеснял
+    бы нужные и держал до 256 МБ в каждом процессе.
+    """
+    prev = getattr(_BYPASS, "on", False)
+    _BYPASS.on = True
+    try:
+        yield
+    finally:
+        _BYPASS.on = prev
+
+
+def cache_stats() -> dict:
+    return {
+        "keystream": KEYSTREAM_CACHE.stats(),
+        "aes_context": AES_CONTEXT_CACHE.stats(),
+    }
+
+
+def _aes_ecb_context(key: bytes):
+    # ECB-объект pycryptodome не хранит состояния между вызовами,
+    # поэтому развёрнутый ключ можно переиспользовать. CBC/CTR-объекты
+    # состояние хранят и каждый раз создаются заново.
+    return AES_CONTEXT_CACHE.get_or_create(
+        ("ecb", _sha256(key)), lambda: AES.new(key, AES.MODE_ECB)
+    )
+
+
+def derive_stream_seed(key: bytes, iv: bytes) -> int:
     h = _sha256(key + iv)
     seed = int.from_bytes(h[:4], "big")
     if seed == 0:
@@ -40,77 +103,621 @@ def _derive_stream_seed(key: bytes, iv: bytes) -> int:
     return seed
 
 
-def _keystream_xorshift(key: bytes, iv: bytes, n_bytes: int) -> bytes:
-    seed = _derive_stream_seed(key, iv)
+# ---------- XorShift32 как линейное отображение над GF(2) ----------
+# Один шаг XorShift32 линеен по битам состояния, поэтому его можно
+# записать матрицей 32x32 над GF(2). Матрица хранится списком столбцов:
+# cols[j] - образ базисного вектора 1 << j.
+
+_MASK32 = 0xFFFFFFFF
+
+# Меньше этого размера дешевле обычный скалярный цикл
+_BULK_MIN_BYTES = 1 << 12
+_BULK_MAX_LANES = 1 << 14
+
+
+def _xorshift_step(x: int) -> int:
+    x ^= (x << 13) & _MASK32
+    x ^= x >> 17
+    x ^= (x << 5) & _MASK32
+    return x
+
+
+def _gf2_apply(cols: list[int], v: int) -> int:
+    r = 0
+    j = 0
+    while v:
+        if v & 1:
+            r ^= cols[j]
+        v >>= 1
+        j += 1
+    return r
+
+
+def _gf2_matmul(a: list[int], b: list[int]) -> list[int]:
+    # (a * b) e_j = a(b e_j)
+    return [_gf2_apply(a, c) for c in b]
+
+
+_XORSHIFT_STEP_COLS = [_xorshift_step(1 << j) for j in range(32)]
+
+
+def _xorshift_jump_cols(n_steps: int) -> list[int]:
+    result = [1 << j for j in range(32)]
+    base = _XORSHIFT_STEP_COLS
+    while n_steps:
+        if n_steps & 1:
+            result = _gf2_matmul(base, result)
+        base = _gf2_matmul(base, base)
+        n_steps >>= 1
+    return result
+
+
+def _xorshift_jump(state: int, n_steps: int) -> int:
+    if n_steps == 0:
+        return state
+    return _gf2_apply(_xorshift_jump_cols(n_steps), state)
+
+
+# ---------- Генерация ключевого потока ----------
+
+def keystream_xorshift_scalar(seed: int, n_bytes: int) -> bytes:
+    # Эталонная побайтовая генерация (как в исходной версии)
     prng = XorShift32(seed)
     return bytes(prng.next_byte() for _ in range(n_bytes))
 
 
-def xor_stream(data: bytes, key: bytes, iv: bytes) -> bytes:
-    ks = _keystream_xorshift(key, iv, len(data))
-    return bytes(a ^ b for a, b in zip(data, ks))
+def _keystream_xorshift_np(seed: int, n_bytes: int) -> np.ndarray:
+    """Ключевой поток XorShift32 одним буфером uint8.
+
+    Поток режется на lanes дорожек по lane_len байт. Начальное состояние
+    каждой дорожки получается прыжком на lane_len шагов (матрица над GF(2)),
+    после чего все дорожки шагают одновременно векторными операциями NumPy.
+    Результат побитово совпадает с побайтовой генерацией.
+    """
+    if n_bytes <= 0:
+        return np.empty(0, dtype=np.uint8)
+    if n_bytes < _BULK_MIN_BYTES:
+        return np.frombuffer(keystream_xorshift_scalar(seed, n_bytes), dtype=np.uint8)
+
+    lanes = min(_BULK_MAX_LANES, math.isqrt(n_bytes))
+    lane_len = -(-n_bytes // lanes)
+
+    jump = _xorshift_jump_cols(lane_len)
+    starts = np.empty(lanes, dtype=np.uint32)
+    state = seed & _MASK32
+    for k in range(lanes):
+        starts[k] = state
+        state = _gf2_apply(jump, state)
+
+    out = np.empty((lane_len, lanes), dtype=np.uint8)
+    x = starts
+    tmp = np.empty_like(x)
+    for t in range(lane_len):
+        np.left_shift(x, 13, out=tmp)
+        x ^= tmp
+        np.right_shift(x, 17, out=tmp)
+        x ^= tmp
+        np.left_shift(x, 5, out=tmp)
+        x ^= tmp
+        out[t] = x  # младший байт состояния
+    return out.T.reshape(-1)[:n_bytes]
+
+
+def _keystream_xorshift(key: bytes, iv: bytes, n_bytes: int) -> bytes:
+    seed = derive_stream_seed(key, iv)
+    return _keystream_xorshift_np(seed, n_bytes).tobytes()
 
 
-def xor_stream_encrypt(data: bytes, key: bytes, iv: bytes) -> bytes:
-    return xor_stream(data, key, iv)
+# Размер куска для многопроцессного XOR
+_PARALLEL_CHUNK = 8 << 20
 
 
-def xor_stream_decrypt(enc_data: bytes, key: bytes, iv: bytes) -> bytes:
-    return xor_stream(enc_data, key, iv)
+def _xor_range_np(buf: np.ndarray, seed: int, offset: int) -> np.ndarray:
+    ks = _keystream_xorshift_np(_xorshift_jump(seed, offset), buf.size)
+    return np.bitwise_xor(buf, ks)
+
+
+def _keystream_chunk_job(seed: int, offset: int, n_bytes: int) -> bytes:
+    return _keystream_xorshift_np(_xorshift_jump(seed, offset), n_bytes).tobytes()
+
+
+def _xor_chunk_job(chunk, seed: int, offset: int) -> bytes:
+    # chunk - байты или ссылка (путь, смещение, длина) на отображённый файл
+    if isinstance(chunk, tuple):
+        chunk = open_ref(chunk)
+    return _xor_range_np(np.frombuffer(chunk, dtype=np.uint8), seed, offset).tobytes()
+
+
+def _resolve_workers(workers: int | None) -> int:
+    if workers is None:
+        return os.cpu_count() or 1
+    if workers < 1:
+        raise ValueError(f"workers must be >= 1, got {workers}")
+    return workers
+
+
+# ---------- Выходные буферы ----------
+# Все функции шифрования принимают необязательный output= - записываемый
+# буфер (bytearray, memoryview, массив NumPy) нужного размера. Результат
+# пишется прямо в него, и функция возвращает этот же объект. output может
+# совпадать с входными данными - тогда шифрование идёт на месте.
+
+def _u8_view(data) -> memoryview:
+    return memoryview(data).cast("B")
+
+
+def _output_view(output, n: int) -> memoryview:
+    view = _u8_view(output)
+    if view.readonly:
+        raise ValueError("output buffer is read-only")
+    if view.nbytes != n:
+        raise ValueError(f"output buffer size {view.nbytes} != data size {n}")
+    return view
+
+
+def xor_stream_range(data: bytes, key: bytes, iv: bytes, offset: int, output=None):
+    """XOR с ключевым потоком, начиная с байта offset (а не с нуля)."""
+    if offset < 0:
+        raise ValueError(f"xor_stream_range: offset must be >= 0, got {offset}")
+    buf = np.frombuffer(data, dtype=np.uint8)
+    ks = _keystream_xorshift_np(_xorshift_jump(derive_stream_seed(key, iv), offset), buf.size)
+    if output is None:
+        return np.bitwise_xor(buf, ks).tobytes()
+    np.bitwise_xor(buf, ks, out=np.frombuffer(_output_view(output, buf.size), dtype=np.uint8))
+    return output
+
+
+def _keystream_cached(key: bytes, iv: bytes, n_bytes: int, workers: int = 1) -> np.ndarray | None:
+    """Ключевой поток из KEYSTREAM_CACHE или новый (и в кэш).
+
+    При workers > 1 новый поток считается кусками в пуле процессов - в
+    процессы уходят только (seed, смещение, длина), не данные. Поток,
+    который не поместится в кэш, при workers > 1 не строится: None.
+    """
+    if getattr(_BYPASS, "on", False):
+        # Большой буфер при workers > 1 - кусками в процессах, без потока целиком
+        return _keystream_xorshift_np(derive_stream_seed(key, iv), n_bytes) if workers == 1 else None
+    cache_key = (_sha256(key), bytes(iv), n_bytes)
+    ks = KEYSTREAM_CACHE.get(cache_key)
+    if ks is not None:
+        return ks
+    seed = derive_stream_seed(key, iv)
+    if workers == 1:
+        ks = _keystream_xorshift_np(seed, n_bytes)
+    elif n_bytes <= KEYSTREAM_CACHE.max_bytes:
+        ks = np.empty(n_bytes, dtype=np.uint8)
+        offsets = range(0, n_bytes, _PARALLEL_CHUNK)
+        sizes = [min(_PARALLEL_CHUNK, n_bytes - off) for off in offsets]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for off, part in zip(offsets, pool.map(_keystream_chunk_job, [seed] * len(sizes), offsets, sizes)):
+                ks[off:off + len(part)] = np.frombuffer(part, dtype=np.uint8)
+    else:
+        return None
+    ks.flags.writeable = False
+    KEYSTREAM_CACHE.put(cache_key, ks)
+    return ks
+
+
+def xor_stream(data: bytes, key: bytes, iv: bytes, workers: int | None = 1, output=None):
+    workers = _resolve_workers(workers)
+    buf = np.frombuffer(data, dtype=np.uint8)
+    n = buf.size
+    dst = None if output is None else np.frombuffer(_output_view(output, n), dtype=np.uint8)
+
+    # Повторный вызов с теми же (key, iv, длина) - только XOR буферов,
+    # в том числе при workers > 1 (проверка обратимости после шифрования)
+    ks = _keystream_cached(key, iv, n, 1 if n < 2 * _PARALLEL_CHUNK else workers)
+    if ks is not None:
+        if dst is None:
+            return np.bitwise_xor(buf, ks).tobytes()
+        np.bitwise_xor(buf, ks, out=dst)
+        return output
+
+    seed = derive_stream_seed(key, iv)
+
+    # Поток больше кэша: куски данных XOR-ятся в процессах, каждый кусок
+    # получает свой участок потока через прыжок на offset
+    offsets = range(0, n, _PARALLEL_CHUNK)
+    ref = mapped_ref(data)
+    if ref is not None:
+        chunks = [sub_ref(ref, off, off + _PARALLEL_CHUNK) for off in offsets]
+    else:
+        chunks = [buf[off:off + _PARALLEL_CHUNK].tobytes() for off in offsets]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        parts = pool.map(_xor_chunk_job, chunks, [seed] * len(chunks), offsets)
+        if dst is None:
+            return b"".join(parts)
+        for off, part in zip(offsets, parts):
+            dst[off:off + len(part)] = np.frombuffer(part, dtype=np.uint8)
+    return output
+
+
+def xor_stream_encrypt(data: bytes, key: bytes, iv: bytes, workers: int | None = 1, output=None):
+    return xor_stream(data, key, iv, workers, output)
+
+
+def xor_stream_decrypt(enc_data: bytes, key: bytes, iv: bytes, workers: int | None = 1, output=None):
+    return xor_stream(enc_data, key, iv, workers, output)
 
 
 # ========== AES (ECB ; CBC ; CTR) ==========
-def aes_ecb_encrypt(data: bytes, key: bytes) -> bytes:
-    if len(data) % AES.block_size != 0:
-        raise ValueError(
-            f"AES-ECB requires data length multiple of {AES.block_size}, got {len(data)}"
-        )
-    cipher = AES.new(key, AES.MODE_ECB)
-    return cipher.encrypt(data)
+# ECB, расшифрование CBC и CTR распараллеливаются по блокам: буфер режется
+# на куски, кратные блоку, и каждый кусок обрабатывается своим объектом AES
+# в пуле потоков. pycryptodome отпускает GIL внутри C-кода, поэтому потоки
+# действительно работают на разных ядрах и пишут сразу в общий выходной буфер.
+
+_AES_PARALLEL_CHUNK = 4 << 20  # кратно AES.block_size
+
+
+def _run_chunked(data, workers: int | None, output, make_job):
+    """Выполняет make_job(lo, hi)(src, dst) по всему буферу.
+
+    При workers > 1 и большом буфере куски обрабатываются в пуле потоков,
+    иначе - одним вызовом. Задания создаются до запуска пула, пока вход
+    ещё не перезаписан (важно для шифрования на месте).
+    """
+    workers = _resolve_workers(workers)
+    src = _u8_view(data)
+    n = src.nbytes
+    if output is None:
+        out = bytearray(n)
+        dst = memoryview(out)
+    else:
+        dst = _output_view(output, n)
+
+    if workers == 1 or n < 2 * _AES_PARALLEL_CHUNK:
+        make_job(0, n)(src, dst)
+    else:
+        jobs = []
+        for lo in range(0, n, _AES_PARALLEL_CHUNK):
+            hi = min(lo + _AES_PARALLEL_CHUNK, n)
+            jobs.append((lo, hi, make_job(lo, hi)))
 
+        def run(job) -> None:
+            lo, hi, fn = job
+            fn(src[lo:hi], dst[lo:hi])
 
-def aes_ecb_decrypt(enc_data: bytes, key: bytes) -> bytes:
-    if len(enc_data) % AES.block_size != 0:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            # list() пробрасывает исключения из потоков
+            list(pool.map(run, jobs))
+
+    if output is None:
+        return bytes(out)
+    return output
+
+
+def _check_block_multiple(mode: str, n: int) -> None:
+    if n % AES.block_size != 0:
         raise ValueError(
-            f"AES-ECB requires data length multiple of {AES.block_size}, got {len(enc_data)}"
+            f"{mode} requires data length multiple of {AES.block_size}, got {n}"
         )
-    cipher = AES.new(key, AES.MODE_ECB)
-    return cipher.decrypt(enc_data)
 
 
-def aes_cbc_encrypt(data: bytes, key: bytes, iv: bytes) -> bytes:
+def aes_ecb_encrypt(data: bytes, key: bytes, workers: int | None = 1, output=None):
+    _check_block_multiple("AES-ECB", _u8_view(data).nbytes)
+    cipher = _aes_ecb_context(key)
+
+    def make_job(lo, hi):
+        return lambda src, dst: cipher.encrypt(src, output=dst)
+
+    return _run_chunked(data, workers, output, make_job)
+
+
+def aes_ecb_decrypt(enc_data: bytes, key: bytes, workers: int | None = 1, output=None):
+    _check_block_multiple("AES-ECB", _u8_view(enc_data).nbytes)
+    cipher = _aes_ecb_context(key)
+
+    def make_job(lo, hi):
+        return lambda src, dst: cipher.decrypt(src, output=dst)
+
+    return _run_chunked(enc_data, workers, output, make_job)
+
+
+def aes_cbc_encrypt(data: bytes, key: bytes, iv: bytes, output=None):
+    # Шифрование CBC последовательно по определению - без workers
     if len(iv) != 16:
         raise ValueError("AES-CBC requires 16-byte IV (got %d)" % len(iv))
-    if len(data) % AES.block_size != 0:
-        raise ValueError(
-            f"AES-CBC requires data length multiple of {AES.block_size}, got {len(data)}"
-        )
-    cipher = AES.new(key, AES.MODE_CBC, iv)
-    return cipher.encrypt(data)
+    _check_block_multiple("AES-CBC", _u8_view(data).nbytes)
 
+    def make_job(lo, hi):
+        return lambda src, dst: AES.new(key, AES.MODE_CBC, iv).encrypt(src, output=dst)
 
-def aes_cbc_decrypt(enc_data: bytes, key: bytes, iv: bytes) -> bytes:
+    return _run_chunked(data, 1, output, make_job)
+
+
+def aes_cbc_decrypt(enc_data: bytes, key: bytes, iv: bytes, workers: int | None = 1, output=None):
     if len(iv) != 16:
         raise ValueError("AES-CBC requires 16-byte IV (got %d)" % len(iv))
-    if len(enc_data) % AES.block_size != 0:
-        raise ValueError(
-            f"AES-CBC requires data length multiple of {AES.block_size}, got {len(enc_data)}"
-        )
-    cipher = AES.new(key, AES.MODE_CBC, iv)
-    return cipher.decrypt(enc_data)
+    enc_view = _u8_view(enc_data)
+    _check_block_multiple("AES-CBC", enc_view.nbytes)
 
+    def make_job(lo, hi):
+        # IV куска - последний блок шифртекста перед ним (копия: вход может
+        # быть перезаписан при расшифровании на месте)
+        chunk_iv = iv if lo == 0 else bytes(enc_view[lo - AES.block_size:lo])
+        return lambda src, dst: AES.new(key, AES.MODE_CBC, chunk_iv).decrypt(src, output=dst)
 
-def aes_ctr_encrypt(data: bytes, key: bytes, nonce8: bytes) -> bytes:
-    if len(nonce8) != 8:
-        raise ValueError("AES-CTR requires 8-byte nonce (got %d)" % len(nonce8))
-    ctr = Counter.new(64, prefix=nonce8, initial_value=0)
-    cipher = AES.new(key, AES.MODE_CTR, counter=ctr)
-    return cipher.encrypt(data)
+    return _run_chunked(enc_data, workers, output, make_job)
 
 
-def aes_ctr_decrypt(enc_data: bytes, key: bytes, nonce8: bytes) -> bytes:
+def aes_ctr_encrypt(data: bytes, key: bytes, nonce8: bytes, workers: int | None = 1, output=None):
     if len(nonce8) != 8:
         raise ValueError("AES-CTR requires 8-byte nonce (got %d)" % len(nonce8))
-    ctr = Counter.new(64, prefix=nonce8, initial_value=0)
-    cipher = AES.new(key, AES.MODE_CTR, counter=ctr)
-    return cipher.encrypt(enc_data)
+
+    def make_job(lo, hi):
+        # Кусок начинается с блока lo // 16 - сдвигаем начальный счётчик
+        ctr = Counter.new(64, prefix=nonce8, initial_value=lo // AES.block_size)
+        return lambda src, dst: AES.new(key, AES.MODE_CTR, counter=ctr).encrypt(src, output=dst)
+
+    return _run_chunked(data, workers, output, make_job)
+
+
+def aes_ctr_decrypt(enc_data: bytes, key: bytes, nonce8: bytes, workers: int | None = 1, output=None):
+    return aes_ctr_encrypt(enc_data, key, nonce8, workers, output)
+
+
+# ========== ChaCha20 ; AES-GCM ==========
+
+def _chacha20_key(key: bytes) -> bytes:
+    # ChaCha20 требует 256-битный ключ; более короткий (AES-128 из CLI)
+    # растягиваем через SHA-256
+    if len(key) == 32:
+        return key
+    return _sha256(key)
+
+
+def chacha20_encrypt(data: bytes, key: bytes, nonce12: bytes, workers: int | None = 1, output=None):
+    if len(nonce12) != 12:
+        raise ValueError("ChaCha20 requires 12-byte nonce (got %d)" % len(nonce12))
+    key32 = _chacha20_key(key)
+
+    def make_job(lo, hi):
+        # Как и CTR, ChaCha20 позволяет начать с любой позиции потока
+        def job(src, dst):
+            cipher = ChaCha20.new(key=key32, nonce=nonce12)
+            cipher.seek(lo)
+            cipher.encrypt(src, output=dst)
+        return job
+
+    return _run_chunked(data, workers, output, make_job)
+
+
+def chacha20_decrypt(enc_data: bytes, key: bytes, nonce12: bytes, workers: int | None = 1, output=None):
+    return chacha20_encrypt(enc_data, key, nonce12, workers, output)
+
+
+def _check_gcm_nonce(nonce12: bytes) -> None:
+    if len(nonce12) != 12:
+        raise ValueError("AES-GCM requires 12-byte nonce (got %d)" % len(nonce12))
+
+
+def aes_gcm_encrypt(data: bytes, key: bytes, nonce12: bytes, output=None) -> tuple:
+    """AES-GCM: возвращает (шифртекст, тег 16 байт).
+
+    GHASH считается последовательно, поэтому workers здесь нет.
+    """
+    _check_gcm_nonce(nonce12)
+    tag = []
+
+    def make_job(lo, hi):
+        def job(src, dst):
+            cipher = AES.new(key, AES.MODE_GCM, nonce=nonce12)
+            tag.append(cipher.encrypt_and_digest(src, output=dst)[1])
+        return job
+
+    enc = _run_chunked(data, 1, output, make_job)
+    return enc, tag[0]
+
+
+def aes_gcm_decrypt(enc_data: bytes, key: bytes, nonce12: bytes, tag: bytes | None, output=None):
+    """Расшифрование AES-GCM с проверкой тега.
+
+    Неверный тег -> ValueError. tag=None - расшифрование без проверки
+    (для сравнения шифртекстов в метриках).
+    """
+    _check_gcm_nonce(nonce12)
+
+    def make_job(lo, hi):
+        def job(src, dst):
+            cipher = AES.new(key, AES.MODE_GCM, nonce=nonce12)
+            if tag is None:
+                cipher.decrypt(src, output=dst)
+            else:
+                cipher.decrypt_and_verify(src, tag, output=dst)
+        return job
+
+    return _run_chunked(enc_data, 1, output, make_job)
+
+
+# ========== ПОТОЧНЫЕ ОБЪЕКТЫ (update / finalize) ==========
+# Принимают данные кусками произвольного размера и хранят состояние между
+# вызовами, так что изображение можно шифровать полосами строк.
+
+class XorStreamCipher:
+
+    def __init__(self, key: bytes, iv: bytes, offset: int = 0) -> None:
+        if offset < 0:
+            raise ValueError(f"XorStreamCipher: offset must be >= 0, got {offset}")
+        self._prng = XorShift32(derive_stream_seed(key, iv))
+        self._prng.jump(offset)
+        self.position = offset
+
+    def update(self, chunk: bytes) -> bytes:
+        n = len(chunk)
+        if n < _BULK_MIN_BYTES:
+            # Мелкие куски: шагаем генератором напрямую, без прыжка
+            ks = bytes(self._prng.next_byte() for _ in range(n))
+            out = bytes(a ^ b for a, b in zip(chunk, ks))
+        else:
+            buf = np.frombuffer(chunk, dtype=np.uint8)
+            out = np.bitwise_xor(buf, _keystream_xorshift_np(self._prng.state, n)).tobytes()
+            self._prng.jump(n)
+        self.position += n
+        return out
+
+    def finalize(self) -> bytes:
+        return b""
+
+
+class _AesBlockStream:
+    # Общая часть ECB/CBC: копим неполный блок до следующего update()
+
+    _mode_name = ""
+
+    def __init__(self, cipher, decrypt: bool) -> None:
+        self._cipher = cipher
+        self._fn = cipher.decrypt if decrypt else cipher.encrypt
+        self._tail = b""
+
+    def update(self, chunk: bytes) -> bytes:
+        data = self._tail + bytes(chunk) if self._tail else chunk
+        n_full = len(data) - len(data) % AES.block_size
+        self._tail = bytes(data[n_full:])
+        if n_full == 0:
+            return b""
+        return self._fn(data[:n_full])
+
+    def finalize(self) -> bytes:
+        if self._tail:
+            raise ValueError(
+                f"{self._mode_name} requires data length multiple of {AES.block_size}, "
+                f"{len(self._tail)} trailing bytes left"
+            )
+        return b""
+
+
+class AesEcbCipher(_AesBlockStream):
+
+    _mode_name = "AES-ECB"
+
+    def __init__(self, key: bytes, decrypt: bool = False) -> None:
+        super().__init__(AES.new(key, AES.MODE_ECB), decrypt)
+
+
+class AesCbcCipher(_AesBlockStream):
+
+    _mode_name = "AES-CBC"
+
+    def __init__(self, key: bytes, iv: bytes, decrypt: bool = False) -> None:
+        if len(iv) != 16:
+            raise ValueError("AES-CBC requires 16-byte IV (got %d)" % len(iv))
+        # Объект pycryptodome сам переносит сцепляющий блок между вызовами
+        super().__init__(AES.new(key, AES.MODE_CBC, iv), decrypt)
+
+
+class AesCtrCipher:
+
+    def __init__(self, key: bytes, nonce8: bytes, initial_value: int = 0) -> None:
+        if len(nonce8) != 8:
+            raise ValueError("AES-CTR requires 8-byte nonce (got %d)" % len(nonce8))
+        ctr = Counter.new(64, prefix=nonce8, initial_value=initial_value)
+        self._cipher = AES.new(key, AES.MODE_CTR, counter=ctr)
+
+    def update(self, chunk: bytes) -> bytes:
+        return self._cipher.encrypt(chunk)
+
+    def finalize(self) -> bytes:
+        return b""
+
+
+class ChaCha20Cipher:
+
+    def __init__(self, key: bytes, nonce12: bytes, offset: int = 0) -> None:
+        if len(nonce12) != 12:
+            raise ValueError("ChaCha20 requires 12-byte nonce (got %d)" % len(nonce12))
+        self._cipher = ChaCha20.new(key=_chacha20_key(key), nonce=nonce12)
+        if offset:
+            self._cipher.seek(offset)
+
+    def update(self, chunk: bytes) -> bytes:
+        return self._cipher.encrypt(chunk)
+
+    def finalize(self) -> bytes:
+        return b""
+
+
+class AesGcmCipher:
+    """AES-GCM кусками. При шифровании тег доступен после finalize() в .tag,
+    при расшифровании с tag finalize() проверяет его (ValueError при подмене).
+    """
+
+    def __init__(self, key: bytes, nonce12: bytes, decrypt: bool = False, tag: bytes | None = None) -> None:
+        _check_gcm_nonce(nonce12)
+        self._cipher = AES.new(key, AES.MODE_GCM, nonce=nonce12)
+        self._decrypt = decrypt
+        self.tag = tag
+
+    def update(self, chunk: bytes) -> bytes:
+        if self._decrypt:
+            return self._cipher.decrypt(chunk)
+        return self._cipher.encrypt(chunk)
+
+    def finalize(self) -> bytes:
+        if not self._decrypt:
+            self.tag = self._cipher.digest()
+        elif self.tag is not None:
+            self._cipher.verify(self.tag)
+        return b""
+
+
+def new_stream_cipher(
+    algo: str,
+    key: bytes,
+    nonce_or_iv: bytes | None,
+    decrypt: bool = False,
+    tag: bytes | None = None,
+):
+    """Создаёт поточный объект по имени алгоритма из CLI (--algo).
+
+    tag - тег AES-GCM для проверки при расшифровании.
+    """
+    if algo == "xor":
+        return XorStreamCipher(key, nonce_or_iv)
+    if algo == "aes-ecb":
+        return AesEcbCipher(key, decrypt)
+    if algo == "aes-cbc":
+        return AesCbcCipher(key, nonce_or_iv, decrypt)
+    if algo == "aes-ctr":
+        return AesCtrCipher(key, nonce_or_iv)
+    if algo == "chacha20":
+        return ChaCha20Cipher(key, nonce_or_iv)
+    if algo == "aes-gcm":
+        return AesGcmCipher(key, nonce_or_iv, decrypt, tag)
+    raise ValueError(f"Unknown algo: {algo}")
+
+
+# ========== РАСШИФРОВАНИЕ ПРОИЗВОЛЬНОГО УЧАСТКА ==========
+# decrypt_range(enc, ..., start, stop) -> открытый текст enc[start:stop] без
+# расшифрования всего шифртекста. Для блочных режимов start и stop кратны
+# 16: ECB независим по блокам, в CBC нужен только предыдущий блок
+# шифртекста, в CTR/GCM/ChaCha20/XOR - сдвиг счётчика или позиции потока.
+
+def xor_decrypt_range(enc_data, key: bytes, iv: bytes, start: int, stop: int) -> bytes:
+    return xor_stream_range(_u8_view(enc_data)[start:stop], key, iv, start)
+
+
+def aes_ecb_decrypt_range(enc_data, key: bytes, start: int, stop: int) -> bytes:
+    return aes_ecb_decrypt(_u8_view(enc_data)[start:stop], key)
+
+
+def aes_cbc_decrypt_range(enc_data, key: bytes, iv: bytes, start: int, stop: int) -> bytes:
+    view = _u8_view(enc_data)
+    prev = iv if start == 0 else bytes(view[start - AES.block_size:start])
+    return aes_cbc_decrypt(view[start:stop], key, prev)
+
+
+def aes_ctr_decrypt_range(enc_data, key: bytes, nonce8: bytes, start: int, stop: int) -> bytes:
+    return AesCtrCipher(key, nonce8, start // AES.block_size).update(_u8_view(enc_data)[start:stop])
+
+
+def chacha20_decrypt_range(enc_data, key: bytes, nonce12: bytes, start: int, stop: int) -> bytes:
+    return ChaCha20Cipher(key, nonce12, start).update(_u8_view(enc_data)[start:stop])
+
+
+def aes_gcm_decrypt_range(enc_data, key: bytes, nonce12: bytes, start: int, stop: int) -> bytes:
+    # Для 96-битного nonce шифрование GCM - это CTR со счётчиком
+    # nonce || 32-битный номер блока, начиная с 2 (1 уходит на тег).
+    # Тег здесь не проверяется.
+    _check_gcm_nonce(nonce12)
+    cipher = AES.new(key, AES.MODE_CTR, nonce=nonce12, initial_value=2 + start // AES.block_size)
+    return cipher.decrypt(_u8_view(enc_data)[start:stop])
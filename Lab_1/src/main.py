@@ -1,13 +1,13 @@
 # -*- coding: utf-8 -*-
-import os
 import argparse
 import json
+import tracemalloc
 from pathlib import Path
-from typing import Dict, Any
 
-from encryptors import *
-from metrics import *
-from utils import *
+from backends import *
+from pipeline import *
+from stages import aggregate_stages, print_stage_table
+from worker import serve
 
 
 def ensure_dirs():
@@ -15,265 +15,46 @@ def ensure_dirs():
     Path("results").mkdir(exist_ok=True)
 
 
-def run_xor(input_path: str, key: bytes) -> Dict[str, Any]:
-    iv = os.urandom(16)
-    rgb, w, h = load_image(input_path)
+def print_cache_stats():
+    for name, st in cache_stats().items():
+        print(f"[cache] {name}: hits={st['hits']} misses={st['misses']} entries={st['entries']}")
 
-    # Шифрование / дешифрование (одна и та же функция)
-    enc = xor_stream_encrypt(rgb, key, iv)
-    dec = xor_stream_encrypt(enc, key, iv)
 
-    stem = Path(input_path).stem
-    out_img = f"imgs/{stem}_xor.png"
-    dec_img = f"imgs/{stem}_xor_dec.png"
+def print_throughput(rows):
+    by_algo = {}
+    for row in rows:
+        by_algo.setdefault(row["algo"], []).append(row)
+    for algo, algo_rows in by_algo.items():
+        enc = sum(r["encrypt_mb_s"] for r in algo_rows) / len(algo_rows)
+        dec_rows = [r["decrypt_mb_s"] for r in algo_rows if r["decrypt_mb_s"] is not None]
+        dec = f"{sum(dec_rows) / len(dec_rows):9.2f} MB/s" if dec_rows else "        -"
+        print(f"[speed] {algo:10s} enc {enc:9.2f} MB/s  dec {dec}")
 
-    save_image_rgb(enc, w, h, out_img)
-    save_image_rgb(dec, w, h, dec_img)
 
-    write_meta(f"results/{stem}_xor_meta.json", "xor", key, input_path, out_img, iv)
+def print_io(rows):
+    write_s = sum(r["io"].get("enc_write_s", 0.0) + r["io"].get("dec_write_s", 0.0) for r in rows)
+    written = sum(r["io"].get("enc_bytes", 0) + r["io"].get("dec_bytes", 0) for r in rows)
+    fmt = rows[0]["io"]["format"] if rows else "-"
+    print(f"[io] {fmt}: {write_s:.2f} s, {written / (1 << 20):.1f} MB written")
 
-    # Метрики
-    ent_src = shannon_entropy(rgb)
-    ent_enc = shannon_entropy(enc)
-    corr_src = corr_adjacent_horizontal(rgb, w, h)
-    corr_enc = corr_adjacent_horizontal(enc, w, h)
-    npcr, uaci = npcr_uaci(rgb, enc)
 
-    # Чувствительность к ключу: меняем 1 бит ключа
-    bad_key = bytes([key[0] ^ 1]) + key[1:]
-    enc_bad = xor_stream_encrypt(rgb, bad_key, iv)
-    npcr_k, uaci_k = key_sensitivity(enc, enc_bad)
-
-    # Гистограммы
-    histogram_png(rgb, w, h, f"results/{stem}_xor_hist_src.png", f"{stem} source")
-    histogram_png(enc, w, h, f"results/{stem}_xor_hist_enc.png", f"{stem} XOR enc")
-
-    # Проверка побитовой обратимости
-    assert rgb == dec, "XOR: дешифрование не восстановило исходник побитово"
-
-    summary = {
-        "algo": "xor",
-        "input": input_path,
-        "output": out_img,
-        "iv_hex": iv.hex(),
-        "entropy_src": ent_src,
-        "entropy_enc": ent_enc,
-        "corr_src": corr_src,
-        "corr_enc": corr_enc,
-        "NPCR_src_vs_enc": npcr,
-        "UACI_src_vs_enc": uaci,
-        "KeySensitivity_NPCR": npcr_k,
-        "KeySensitivity_UACI": uaci_k,
-    }
-    write_metrics_json(f"results/{stem}_xor_metrics.json", summary)
-    print(f"[OK] XOR: {input_path} -> {out_img}")
-    return summary
-
-
-def run_aes_ecb(input_path: str, key: bytes) -> Dict[str, Any]:
-    rgb, w, h = load_image(input_path)
-    enc = aes_ecb_encrypt(rgb, key)
-    dec = aes_ecb_decrypt(enc, key)
-
-    stem = Path(input_path).stem
-    out_img = f"imgs/{stem}_aes-ecb.png"
-    dec_img = f"imgs/{stem}_aes-ecb_dec.png"
-
-    save_image_rgb(enc, w, h, out_img)
-    save_image_rgb(dec, w, h, dec_img)
-
-    write_meta(
-        f"results/{stem}_aes-ecb_meta.json",
-        "aes-ecb",
-        key,
-        input_path,
-        out_img,
-        None,
-    )
-
-    ent_src = shannon_entropy(rgb)
-    ent_enc = shannon_entropy(enc)
-    corr_src = corr_adjacent_horizontal(rgb, w, h)
-    corr_enc = corr_adjacent_horizontal(enc, w, h)
-
-    # NPCR/UACI между исходником и шифром
-    npcr, uaci = npcr_uaci(rgb, enc)
-
-    # Чувствительность к ключу
-    bad_key = bytes([key[0] ^ 1]) + key[1:]
-    enc_bad = aes_ecb_encrypt(rgb, bad_key)
-    npcr_k, uaci_k = key_sensitivity(enc, enc_bad)
-
-    histogram_png(
-        rgb, w, h,
-        f"results/{stem}_aes-ecb_hist_src.png",
-        f"{stem} source"
-    )
-    histogram_png(
-        enc, w, h,
-        f"results/{stem}_aes-ecb_hist_enc.png",
-        f"{stem} AES-ECB enc"
-    )
-
-    assert rgb == dec, "AES-ECB: дешифрование не восстановило исходник"
-
-    summary = {
-        "algo": "aes-ecb",
-        "input": input_path,
-        "output": out_img,
-        "entropy_src": ent_src,
-        "entropy_enc": ent_enc,
-        "corr_src": corr_src,
-        "corr_enc": corr_enc,
-        "NPCR_src_vs_enc": npcr,
-        "UACI_src_vs_enc": uaci,
-        "KeySensitivity_NPCR": npcr_k,
-        "KeySensitivity_UACI": uaci_k,
-    }
-    write_metrics_json(f"results/{stem}_aes-ecb_metrics.json", summary)
-    print(f"[OK] AES-ECB: {input_path} -> {out_img}")
-    return summary
-
-
-def run_aes_cbc(input_path: str, key: bytes) -> Dict[str, Any]:
-    iv = os.urandom(16)
-
-    rgb, w, h = load_image(input_path)
-    enc = aes_cbc_encrypt(rgb, key, iv)
-    dec = aes_cbc_decrypt(enc, key, iv)
-
-    stem = Path(input_path).stem
-    out_img = f"imgs/{stem}_aes-cbc.png"
-    dec_img = f"imgs/{stem}_aes-cbc_dec.png"
-
-    save_image_rgb(enc, w, h, out_img)
-    save_image_rgb(dec, w, h, dec_img)
-
-    write_meta(
-        f"results/{stem}_aes-cbc_meta.json",
-        "aes-cbc",
-        key,
-        input_path,
-        out_img,
-        iv,
-    )
-
-    ent_src = shannon_entropy(rgb)
-    ent_enc = shannon_entropy(enc)
-    corr_src = corr_adjacent_horizontal(rgb, w, h)
-    corr_enc = corr_adjacent_horizontal(enc, w, h)
-
-    # NPCR/UACI между исходником и шифром
-    npcr, uaci = npcr_uaci(rgb, enc)
-
-    bad_key = bytes([key[0] ^ 1]) + key[1:]
-    enc_bad = aes_cbc_encrypt(rgb, bad_key, iv)
-    npcr_k, uaci_k = key_sensitivity(enc, enc_bad)
-
-    histogram_png(
-        rgb, w, h,
-        f"results/{stem}_aes-cbc_hist_src.png",
-        f"{stem} source"
-    )
-    histogram_png(
-        enc, w, h,
-        f"results/{stem}_aes-cbc_hist_enc.png",
-        f"{stem} AES-CBC enc"
-    )
-
-    assert rgb == dec, "AES-CBC: дешифрование не восстановило исходник"
-
-    summary = {
-        "algo": "aes-cbc",
-        "input": input_path,
-        "output": out_img,
-        "iv_hex": iv.hex(),
-        "entropy_src": ent_src,
-        "entropy_enc": ent_enc,
-        "corr_src": corr_src,
-        "corr_enc": corr_enc,
-        "NPCR_src_vs_enc": npcr,
-        "UACI_src_vs_enc": uaci,
-        "KeySensitivity_NPCR": npcr_k,
-        "KeySensitivity_UACI": uaci_k,
-    }
-    write_metrics_json(f"results/{stem}_aes-cbc_metrics.json", summary)
-    print(f"[OK] AES-CBC: {input_path} -> {out_img} (IV: {iv.hex()[:16]}...)")
-    return summary
-
-
-def run_aes_ctr(input_path: str, key: bytes) -> Dict[str, Any]:
-    nonce8 = os.urandom(8)
-
-    rgb, w, h = load_image(input_path)
-    enc = aes_ctr_encrypt(rgb, key, nonce8)
-    dec = aes_ctr_decrypt(enc, key, nonce8)
-
-    stem = Path(input_path).stem
-    out_img = f"imgs/{stem}_aes-ctr.png"
-    dec_img = f"imgs/{stem}_aes-ctr_dec.png"
-
-    save_image_rgb(enc, w, h, out_img)
-    save_image_rgb(dec, w, h, dec_img)
-
-    write_meta(
-        f"results/{stem}_aes-ctr_meta.json",
-        "aes-ctr",
-        key,
-        input_path,
-        out_img,
-        nonce8,
-    )
-
-    ent_src = shannon_entropy(rgb)
-    ent_enc = shannon_entropy(enc)
-    corr_src = corr_adjacent_horizontal(rgb, w, h)
-    corr_enc = corr_adjacent_horizontal(enc, w, h)
-
-    # NPCR/UACI между исходником и шифром
-    npcr, uaci = npcr_uaci(rgb, enc)
-
-    bad_key = bytes([key[0] ^ 1]) + key[1:]
-    enc_bad = aes_ctr_encrypt(rgb, bad_key, nonce8)
-    npcr_k, uaci_k = key_sensitivity(enc, enc_bad)
-
-    histogram_png(
-        rgb, w, h,
-        f"results/{stem}_aes-ctr_hist_src.png",
-        f"{stem} source"
-    )
-    histogram_png(
-        enc, w, h,
-        f"results/{stem}_aes-ctr_hist_enc.png",
-        f"{stem} AES-CTR enc"
-    )
-
-    assert rgb == dec, "AES-CTR: дешифрование не восстановило исходник"
-
-    summary = {
-        "algo": "aes-ctr",
-        "input": input_path,
-        "output": out_img,
-        "nonce_hex": nonce8.hex(),
-        "entropy_src": ent_src,
-        "entropy_enc": ent_enc,
-        "corr_src": corr_src,
-        "corr_enc": corr_enc,
-        "NPCR_src_vs_enc": npcr,
-        "UACI_src_vs_enc": uaci,
-        "KeySensitivity_NPCR": npcr_k,
-        "KeySensitivity_UACI": uaci_k,
-    }
-    write_metrics_json(f"results/{stem}_aes-ctr_metrics.json", summary)
-    print(f"[OK] AES-CTR: {input_path} -> {out_img} (Nonce: {nonce8.hex()})")
-    return summary
+def print_memory(rows):
+    peaks = {}
+    for r in rows:
+        for name, mem in r.get("stages_memory", {}).items():
+            peaks[name] = max(peaks.get(name, 0.0), mem["peak_mb"])
+    for name, peak in sorted(peaks.items(), key=lambda kv: -kv[1])[:5]:
+        print(f"[mem] {name:24s} peak {peak:9.1f} MB")
+    modes = sorted({r["memory"]["mode"] for r in rows if "memory" in r})
+    if modes:
+        print(f"[mem] mode: {', '.join(modes)}")
 
 
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument(
         "--algo",
-        choices=["xor", "aes-ecb", "aes-cbc", "aes-ctr"],
+        choices=list(BACKENDS),
         help="Алгоритм шифрования"
     )
     ap.add_argument(
@@ -290,44 +71,200 @@ def main():
         action="store_true",
         help="прогнать все алгоритмы по всем PNG в imgs/",
     )
+    ap.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="число потоков/процессов для XOR, AES-ECB, AES-CTR и расшифрования AES-CBC",
+    )
+    ap.add_argument(
+        "--keystream-cache-mb",
+        type=int,
+        default=256,
+        help="предел памяти LRU-кэша ключевых потоков XOR (МБ, 0 - выключить)",
+    )
+    ap.add_argument(
+        "--key-sweep",
+        metavar="BITS",
+        help="чувствительность к каждому биту ключа: 'all' или список '0,5,17-31'",
+    )
+    ap.add_argument(
+        "--sweep-workers",
+        type=int,
+        help="число процессов для --key-sweep (по умолчанию - по числу ядер)",
+    )
+    ap.add_argument(
+        "--corr-sample",
+        type=int,
+        metavar="N",
+        help="оценивать корреляции по N случайным парам пикселей (с доверительным интервалом)",
+    )
+    ap.add_argument(
+        "--corr-seed",
+        type=int,
+        default=0,
+        help="seed генератора для --corr-sample",
+    )
+    ap.add_argument(
+        "--local-entropy-tiles",
+        default="32",
+        help="размеры плиток для карты локальной энтропии через запятую ('' - выключить)",
+    )
+    ap.add_argument(
+        "--local-entropy-threshold",
+        type=float,
+        default=7.0,
+        help="порог (бит) для доли плиток с низкой локальной энтропией",
+    )
+    ap.add_argument(
+        "--write-workers",
+        type=int,
+        default=2,
+        help="потоки фоновой записи PNG/JSON (0 - писать синхронно)",
+    )
+    ap.add_argument(
+        "--image-format",
+        choices=list(IMAGE_FORMATS),
+        default="png",
+        help="формат шифртекста: png, raw (.rgb с заголовком) или npy",
+    )
+    ap.add_argument(
+        "--png-compress-level",
+        type=int,
+        choices=range(10),
+        metavar="0-9",
+        help="уровень сжатия zlib для PNG (0 - без сжатия)",
+    )
+    ap.add_argument(
+        "--no-save-dec",
+        action="store_true",
+        help="не сохранять расшифрованные изображения (проверка побитовой обратимости остаётся)",
+    )
+    ap.add_argument(
+        "--no-result-cache",
+        action="store_true",
+        help="не брать готовые результаты из results/cache (пересчитать всё)",
+    )
+    ap.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="--run-all/--serve: число процессов, обрабатывающих изображения параллельно",
+    )
+    ap.add_argument(
+        "--verify",
+        choices=VERIFY_POLICIES,
+        default="full",
+        help="проверка обратимости: full (побайтно), hash (SHA-256 потоком, без *_dec), "
+             "sample (случайные строки), off",
+    )
+    ap.add_argument(
+        "--verify-rows",
+        type=int,
+        default=16,
+        help="число строк для --verify sample",
+    )
+    ap.add_argument(
+        "--profile",
+        action="store_true",
+        help="cProfile каждой задачи: results/profile/<имя>_<algo>.prof и .txt",
+    )
+    ap.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="tracemalloc: пик памяти по стадиям в summary (stages_memory); заметно замедляет",
+    )
+    ap.add_argument(
+        "--memory-budget",
+        type=float,
+        metavar="MB",
+        help="бюджет памяти на задачу; если оценка пика больше - потоковый режим "
+             "(проверка по хэшу, анализ полосами, без *_dec)",
+    )
+    ap.add_argument(
+        "--serve",
+        action="store_true",
+        help="резидентный режим: задачи JSON-строками из stdin (или --socket), "
+             "по строке-результату на задачу; см. worker.py",
+    )
+    ap.add_argument(
+        "--socket",
+        metavar="PATH",
+        help="--serve: слушать Unix-сокет вместо stdin",
+    )
     args = ap.parse_args()
 
     ensure_dirs()
-    key = args.key.encode("utf-8")
-    key = key.ljust(16, b"\0")[:16]  # нормируем к 16 байтам (AES-128)
+    set_keystream_cache_limit(args.keystream_cache_mb << 20)
+    key = normalize_key(args.key)
+    opts = RunOptions(
+        workers=args.workers,
+        sweep_bits=parse_key_bits(args.key_sweep, len(key)) if args.key_sweep else None,
+        sweep_workers=args.sweep_workers,
+        corr_sample=args.corr_sample,
+        corr_seed=args.corr_seed,
+        local_entropy_tiles=tuple(int(k) for k in args.local_entropy_tiles.split(",") if k.strip()),
+        local_entropy_threshold=args.local_entropy_threshold,
+        image_format=args.image_format,
+        compress_level=args.png_compress_level,
+        save_decrypted=not args.no_save_dec,
+        result_cache=None if args.no_result_cache else ResultCache(),
+        verify=args.verify,
+        verify_rows=args.verify_rows,
+        profile=args.profile,
+        trace_memory=args.trace_memory,
+        memory_budget=int(args.memory_budget * (1 << 20)) if args.memory_budget else None,
+    )
+    if args.trace_memory:
+        tracemalloc.start()
+    if args.serve:
+        # --key - ключ по умолчанию для задач без key/key_file/key_env
+        serve(opts, key, jobs=args.jobs, write_workers=args.write_workers, socket_path=args.socket)
+        return
 
+    # Файлы пишутся в фоне; выход из with дожидается всех записей
+    errors = []
+    with ArtifactWriter(args.write_workers) as writer:
+        opts.writer = writer
+        rows = run(args, key, opts, errors)
+
+    # summary_all - после flush: тайминги записи (io, стадии) к этому моменту готовы
     if args.run_all:
-        inputs = sorted(Path("imgs").glob("*.png"))
-        if not inputs:
-            raise SystemExit("В папке imgs нет входных PNG")
-        rows = []
-        for p in inputs:
-            rows.append(run_xor(str(p), key))
-            rows.append(run_aes_ecb(str(p), key))
-            rows.append(run_aes_cbc(str(p), key))
-            rows.append(run_aes_ctr(str(p), key))
+        stages = aggregate_stages(rows)
         Path("results/summary_all.json").write_text(
-            json.dumps(rows, indent=2),
+            json.dumps({"results": rows, **stages}, indent=2),
             encoding="utf-8"
         )
         print("[OK] summary: results/summary_all.json")
-        return
+        print_throughput(rows)
+        print_io(rows)
+        print_stage_table(stages["stages"])
+        print_memory(rows)
+    print_cache_stats()
+    if opts.result_cache is not None:
+        st = opts.result_cache.stats()
+        print(f"[cache] results: hits={st['hits']} misses={st['misses']} ({st['root']})")
+    if errors:
+        Path("results/failures_all.json").write_text(json.dumps(errors, indent=2), encoding="utf-8")
+        raise SystemExit(f"[FAIL] {len(errors)} задач(и) с ошибкой, см. results/failures_all.json")
+
+
+def run(args, key: bytes, opts: RunOptions, errors: list):
+    if args.run_all:
+        inputs = sorted(Path("imgs").glob("*.png"))
+        if not inputs:
+            raise SystemExit("В папке imgs нет входных PNG")
+        rows, grid_errors = run_grid(
+            [str(p) for p in inputs], list(BACKENDS), key, opts,
+            jobs=args.jobs, write_workers=args.write_workers,
+        )
+        errors.extend(grid_errors)
+        return rows
 
     if not args.algo or not args.input:
         raise SystemExit("Нужно указать --algo и --input, либо --run-all")
 
-    input_path = args.input
-    if not Path(input_path).exists():
-        input_path = "imgs/" + input_path
-
-    if args.algo == "xor":
-        run_xor(input_path, key)
-    elif args.algo == "aes-ecb":
-        run_aes_ecb(input_path, key)
-    elif args.algo == "aes-cbc":
-        run_aes_cbc(input_path, key)
-    elif args.algo == "aes-ctr":
-        run_aes_ctr(input_path, key)
+    return run_image(resolve_input(args.input), [args.algo], key, opts)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import numpy as np
+
+
+# ========== Буферы, отображённые из файла ==========
+# Сырые изображения (.rgb, .npy) открываются через np.memmap, и в шифры и
+# метрики уходит memoryview только для чтения - без декодирования и копии.
+# В пулы процессов такой буфер передаётся не содержимым, а ссылкой
+# (путь, смещение, длина): процесс отображает тот же файл, и страницы кэша
+# ОС общие для всех процессов.
+
+def map_file(path: str, offset: int, nbytes: int) -> memoryview:
+    """memoryview только для чтения на nbytes байт файла начиная с offset."""
+    if nbytes == 0:
+        return memoryview(b"")
+    return memoryview(np.memmap(path, dtype=np.uint8, mode="r", offset=offset, shape=(nbytes,)))
+
+
+def mapped_ref(data) -> tuple[str, int, int] | None:
+    """(путь, смещение, длина) для буфера из map_file(), иначе None."""
+    if not isinstance(data, memoryview):
+        return None
+    mm = data.obj
+    if not isinstance(mm, np.memmap) or mm.filename is None or mm.nbytes != data.nbytes:
+        return None
+    return mm.filename, mm.offset, mm.nbytes
+
+
+def sub_ref(ref: tuple[str, int, int], start: int, stop: int) -> tuple[str, int, int]:
+    path, offset, nbytes = ref
+    stop = min(stop, nbytes)
+    return path, offset + start, stop - start
+
+
+def open_ref(ref: tuple[str, int, int]) -> memoryview:
+    return map_file(*ref)
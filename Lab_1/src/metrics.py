@@ -1,5 +1,8 @@
 # -*- coding: utf-8 -*-
 import math
+from statistics import NormalDist
+
+import numpy as np
 
 
 # ================== Преобразования ==================
@@ -48,6 +51,10 @@ def _corr_from_pairs(pairs_iter):
         sum_xy += X * Y
         n_pairs += 1
 
+    return _corr_from_sums(n_pairs, sum_x, sum_y, sum_x2, sum_y2, sum_xy)
+
+
+def _corr_from_sums(n_pairs, sum_x, sum_y, sum_x2, sum_y2, sum_xy) -> float:
     if n_pairs == 0:
         return float("nan")
 
@@ -63,15 +70,118 @@ def _corr_from_pairs(pairs_iter):
     return cov / math.sqrt(var_x * var_y)
 
 
-# ================== Энтропия ==================
+# ================== Векторные ядра (NumPy) ==================
+# Для целых значений пикселей все суммы в float64 точны (меньше 2**53),
+# поэтому результаты совпадают с построчными версиями выше.
 
-def shannon_entropy(data: bytes) -> float:
-    if not data:
+def _as_u8(data) -> np.ndarray:
+    return np.frombuffer(data, dtype=np.uint8)
+
+
+def _gray_array(rgb_bytes, width: int, height: int) -> np.ndarray:
+    """Яркость (как rgb_to_gray) массивом (height, width) uint8."""
+    n = memoryview(rgb_bytes).nbytes
+    if n != width * height * 3:
+        raise ValueError(
+            f"rgb_bytes size ({n}) != width*height*3 ({width*height*3})"
+        )
+    px = _as_u8(rgb_bytes).reshape(height, width, 3)
+    # Тот же порядок операций над float64, что и в rgb_to_gray
+    y = 0.299 * px[..., 0] + 0.587 * px[..., 1]
+    y += 0.114 * px[..., 2]
+    y += 0.5
+    np.floor(y, out=y)
+    return np.clip(y, 0, 255).astype(np.uint8)
+
+
+def _corr_from_arrays(x: np.ndarray, y: np.ndarray) -> float:
+    # x, y - float64-массивы (можно срезы-представления без копирования)
+    n = x.size
+    if n == 0:
+        return float("nan")
+    return _corr_from_sums(
+        n,
+        float(x.sum()),
+        float(y.sum()),
+        float(np.einsum("ij,ij->", x, x)),
+        float(np.einsum("ij,ij->", y, y)),
+        float(np.einsum("ij,ij->", x, y)),
+    )
+
+
+_LEVELS = np.arange(256, dtype=np.float64)
+
+
+def _directional_corr(plane: np.ndarray, hist: np.ndarray | None = None) -> dict:
+    """Корреляции по трём направлениям для матрицы (height, width) uint8.
+
+    Суммы x и x^2 каждого направления получаются из гистограммы всей
+    матрицы за вычетом крайней строки/столбца, так что по всем пикселям
+    для каждого направления проходит только сумма произведений соседей.
+    """
+    h, w = plane.shape
+    nan = float("nan")
+    result = {"horizontal": nan, "vertical": nan, "diagonal": nan}
+    if h == 0 or w == 0:
+        return result
+
+    if hist is None:
+        hist = np.bincount(plane.reshape(-1), minlength=256)
+    hist = hist.astype(np.float64)
+    s1 = float(hist @ _LEVELS)
+    s2 = float(hist @ (_LEVELS * _LEVELS))
+
+    p = plane.astype(np.float64)
+
+    def edge(v):
+        # (сумма, сумма квадратов) крайней строки/столбца или пикселя
+        return float(np.sum(v)), float(np.sum(v * v))
+
+    top, bottom = edge(p[0]), edge(p[-1])
+    left, right = edge(p[:, 0]), edge(p[:, -1])
+    first, last = edge(p[0, 0]), edge(p[-1, -1])
+
+    def corr(n, cut_x, cut_y, x, y):
+        # cut_x / cut_y - то, что не входит в x / y (с учётом двойного вычета)
+        return _corr_from_sums(
+            n,
+            s1 - cut_x[0], s1 - cut_y[0],
+            s2 - cut_x[1], s2 - cut_y[1],
+            float(np.einsum("ij,ij->", x, y)),
+        )
+
+    def minus(a, b, c):
+        return a[0] + b[0] - c[0], a[1] + b[1] - c[1]
+
+    if w >= 2:
+        result["horizontal"] = corr(h * (w - 1), right, left, p[:, :-1], p[:, 1:])
+    if h >= 2:
+        result["vertical"] = corr((h - 1) * w, bottom, top, p[:-1, :], p[1:, :])
+    if w >= 2 and h >= 2:
+        result["diagonal"] = corr(
+            (h - 1) * (w - 1),
+            minus(bottom, right, last),
+            minus(top, left, first),
+            p[:-1, :-1], p[1:, 1:],
+        )
+    return result
+
+
+# Гистограммы каналов нужны энтропии, histogram_png и анализу: analyze_image
+# возвращает их в "histograms", и дальше они передаются явно (hists=), без
+# глобального кэша, который держал бы ссылки на целые изображения.
+def channel_histograms(rgb_bytes) -> np.ndarray:
+    """Гистограммы R, G, B одним проходом: массив (3, 256) int64."""
+    px = _as_u8(rgb_bytes)
+    if px.size % 3 != 0:
+        raise ValueError(f"rgb_bytes size ({px.size}) is not a multiple of 3")
+    px = px.reshape(-1, 3)
+    return np.stack([np.bincount(px[:, c], minlength=256) for c in range(3)])
+
+
+def _entropy_from_counts(counts, total: int) -> float:
+    if total == 0:
         return 0.0
-    counts = [0] * 256
-    total = len(data)
-    for b in data:
-        counts[b] += 1
     ent = 0.0
     for c in counts:
         if c:
@@ -80,67 +190,268 @@ def shannon_entropy(data: bytes) -> float:
     return ent
 
 
-# ================== Корреляции соседних пикселей ==================
+def analyze_image(rgb_bytes, width: int, height: int, correlations: bool = True) -> dict:
+    """Все метрики одного изображения за один проход.
 
-def corr_adjacent_horizontal(rgb_bytes: bytes, width: int, height: int) -> float:
-    if width < 2 or height < 1:
-        return float("nan")
+    Возвращает энтропию Шеннона по всем байтам, гистограммы каналов и
+    корреляции соседних пикселей (горизонталь/вертикаль/диагональ) по
+    яркости и по каждому каналу. correlations=False пропускает полные
+    корреляции (например, когда они оцениваются по выборке).
+    """
+    hists = channel_histograms(rgb_bytes)
+    total = int(hists.sum())
+    result = {
+        "entropy": _entropy_from_counts(hists.sum(axis=0).tolist(), total),
+        "histograms": {name: hists[c].tolist() for c, name in enumerate(("R", "G", "B"))},
+    }
+    if not correlations:
+        return result
 
-    gray = _rgb_bytes_to_gray_matrix(rgb_bytes, width, height)
+    px = _as_u8(rgb_bytes).reshape(height, width, 3)
+    gray = _gray_array(rgb_bytes, width, height)
 
-    def pairs():
-        for y in range(height):
-            row = gray[y]
-            for x in range(width - 1):
-                yield row[x], row[x + 1]
+    corr = {"luma": _directional_corr(gray)}
+    for c, name in enumerate(("R", "G", "B")):
+        corr[name] = _directional_corr(px[..., c], hists[c])
+    result["corr"] = corr
+    return result
 
-    return _corr_from_pairs(pairs())
 
+# ================== Энтропия ==================
 
-def corr_adjacent_vertical(rgb_bytes: bytes, width: int, height: int) -> float:
-    if height < 2 or width < 1:
-        return float("nan")
+def shannon_entropy(data: bytes) -> float:
+    counts = np.bincount(_as_u8(data), minlength=256)
+    return _entropy_from_counts(counts.tolist(), int(counts.sum()))
+
+
+# ================== Локальная энтропия по плиткам ==================
+# Для каждого размера k гистограммы плиток k x k считаются одним bincount по
+# всем трём каналам сразу (индекс = (плитка, канал, значение)). Изображение
+# идёт полосами по нескольку рядов плиток, так что частоты и индексы
+# занимают не больше _TILE_BAND_ENTRIES элементов при любых размерах плиток.
+
+_TILE_BAND_ENTRIES = 1 << 20
+
+
+def _tile_band_histograms(px: np.ndarray, k: int, ty0: int, ty1: int, tx: int) -> np.ndarray:
+    # Ряды плиток ty0..ty1 -> частоты (ty1 - ty0, tx, 3, 256)
+    rows = ty1 - ty0
+    band = px[ty0 * k:ty1 * k, :tx * k].reshape(rows, k, tx, k, 3)
+    tile = np.arange(rows, dtype=np.int32)[:, None, None, None, None] * tx \
+        + np.arange(tx, dtype=np.int32)[None, None, :, None, None]
+    idx = (tile * 3 + np.arange(3, dtype=np.int32)) * 256 + band
+    return np.bincount(idx.reshape(-1), minlength=rows * tx * 768).reshape(rows, tx, 3, 256)
+
+
+def _tile_entropy(counts: np.ndarray, n: int, clogc: np.ndarray) -> np.ndarray:
+    # H = log2(n) - sum(c * log2 c) / n по последней оси; c * log2 c берётся
+    # из таблицы для целых 0..n (частота в плитке из n пикселей не больше n)
+    return math.log2(n) - clogc[counts].sum(axis=-1) / n
+
+
+def local_entropy_maps(rgb_bytes, width: int, height: int, tile_sizes=(32,)) -> dict:
+    """Карты энтропии по плиткам k x k для каждого размера k.
+
+    Возвращает {k: массив (3, height // k, width // k)} - по каналам R, G, B.
+    Неполные плитки у правого и нижнего края не учитываются.
+    """
+    tile_sizes = sorted(set(int(k) for k in tile_sizes))
+    if not tile_sizes or tile_sizes[0] < 1:
+        raise ValueError(f"tile sizes must be >= 1, got {tile_sizes}")
+
+    px = _as_u8(rgb_bytes).reshape(height, width, 3)
+    maps = {k: np.zeros((3, height // k, width // k)) for k in tile_sizes}
+    for k in tile_sizes:
+        ty, tx = height // k, width // k
+        if ty == 0 or tx == 0:
+            continue
+        c = np.arange(k * k + 1, dtype=np.float64)
+        clogc = c * np.log2(np.maximum(c, 1.0))
+        # Рядов плиток в полосе: ограничены и частоты, и индексы пикселей
+        per_row = tx * max(768, k * k * 3)
+        step = max(1, _TILE_BAND_ENTRIES // per_row)
+        for ty0 in range(0, ty, step):
+            ty1 = min(ty, ty0 + step)
+            counts = _tile_band_histograms(px, k, ty0, ty1, tx)
+            maps[k][:, ty0:ty1] = _tile_entropy(counts, k * k, clogc).transpose(2, 0, 1)
+    return maps
+
+
+def local_entropy_stats(tile_map: np.ndarray, threshold: float = 7.0) -> dict:
+    """min/mean/max, 5-й перцентиль и доля плиток ниже threshold бит."""
+    mean_map = tile_map.mean(axis=0)
+    if mean_map.size == 0:
+        return {"tiles": 0}
+    return {
+        "tiles": int(mean_map.size),
+        "min": float(mean_map.min()),
+        "p5": float(np.percentile(mean_map, 5)),
+        "mean": float(mean_map.mean()),
+        "max": float(mean_map.max()),
+        "threshold": threshold,
+        "low_fraction": float((mean_map < threshold).mean()),
+        "per_channel_mean": {
+            name: float(tile_map[c].mean()) for c, name in enumerate(("R", "G", "B"))
+        },
+    }
 
-    gray = _rgb_bytes_to_gray_matrix(rgb_bytes, width, height)
 
-    def pairs():
-        for y in range(height - 1):
-            row = gray[y]
-            row_next = gray[y + 1]
-            for x in range(width):
-                yield row[x], row_next[x]
+# ================== Корреляции соседних пикселей ==================
 
-    return _corr_from_pairs(pairs())
+def corr_adjacent_horizontal(
+    rgb_bytes: bytes, width: int, height: int, sample: int | None = None, seed: int = 0
+) -> float:
+    if width < 2 or height < 1:
+        return float("nan")
+    if sample is not None:
+        return corr_adjacent_sampled(rgb_bytes, width, height, "horizontal", sample, seed)["estimate"]
+    gray = _gray_array(rgb_bytes, width, height).astype(np.float64)
+    return _corr_from_arrays(gray[:, :-1], gray[:, 1:])
 
 
-def corr_adjacent_diagonal(rgb_bytes: bytes, width: int, height: int) -> float:
-    if height < 2 or width < 2:
+def corr_adjacent_vertical(
+    rgb_bytes: bytes, width: int, height: int, sample: int | None = None, seed: int = 0
+) -> float:
+    if height < 2 or width < 1:
         return float("nan")
+    if sample is not None:
+        return corr_adjacent_sampled(rgb_bytes, width, height, "vertical", sample, seed)["estimate"]
+    gray = _gray_array(rgb_bytes, width, height).astype(np.float64)
+    return _corr_from_arrays(gray[:-1, :], gray[1:, :])
 
-    gray = _rgb_bytes_to_gray_matrix(rgb_bytes, width, height)
 
-    def pairs():
-        for y in range(height - 1):
-            row = gray[y]
-            row_next = gray[y + 1]
-            for x in range(width - 1):
-                yield row[x], row_next[x + 1]
+def corr_adjacent_diagonal(
+    rgb_bytes: bytes, width: int, height: int, sample: int | None = None, seed: int = 0
+) -> float:
+    if height < 2 or width < 2:
+        return float("nan")
+    if sample is not None:
+        return corr_adjacent_sampled(rgb_bytes, width, height, "diagonal", sample, seed)["estimate"]
+    gray = _gray_array(rgb_bytes, width, height).astype(np.float64)
+    return _corr_from_arrays(gray[:-1, :-1], gray[1:, 1:])
+
+
+# ---------- Оценка по случайной выборке пар ----------
+# Как в статьях по шифрованию изображений: берём N случайных пар соседних
+# пикселей. Яркость считается только для выбранных пикселей, поэтому
+# стоимость не зависит от разрешения изображения.
+
+# Смещение соседа (dy, dx) для каждого направления
+_DIRECTIONS = {
+    "horizontal": (0, 1),
+    "vertical": (1, 0),
+    "diagonal": (1, 1),
+}
+
+
+def _gray_at(px: np.ndarray, idx: np.ndarray) -> np.ndarray:
+    # px - байты RGB, idx - номера пикселей; формула как в rgb_to_gray
+    base = idx * 3
+    y = 0.299 * px[base] + 0.587 * px[base + 1]
+    y += 0.114 * px[base + 2]
+    y += 0.5
+    return np.clip(np.floor(y), 0, 255).astype(np.uint8)
+
+
+def corr_adjacent_sampled(
+    rgb_bytes: bytes,
+    width: int,
+    height: int,
+    direction: str = "horizontal",
+    n_pairs: int = 3000,
+    seed: int = 0,
+    confidence: float = 0.95,
+) -> dict:
+    """Корреляция соседних пикселей по n_pairs случайным парам.
+
+    Возвращает оценку, доверительный интервал (преобразование Фишера) и
+    сами пары яркостей ("x", "y") для диаграммы рассеяния.
+    """
+    if direction not in _DIRECTIONS:
+        raise ValueError(f"direction must be one of {sorted(_DIRECTIONS)}, got {direction!r}")
+    if n_pairs < 1:
+        raise ValueError(f"n_pairs must be >= 1, got {n_pairs}")
+    n = memoryview(rgb_bytes).nbytes
+    if n != width * height * 3:
+        raise ValueError(
+            f"rgb_bytes size ({n}) != width*height*3 ({width*height*3})"
+        )
 
-    return _corr_from_pairs(pairs())
+    dy, dx = _DIRECTIONS[direction]
+    result = {
+        "direction": direction,
+        "n_pairs": n_pairs,
+        "seed": seed,
+        "confidence": confidence,
+        "estimate": float("nan"),
+        "ci_low": float("nan"),
+        "ci_high": float("nan"),
+        "x": [],
+        "y": [],
+    }
+    if width - dx < 1 or height - dy < 1:
+        return result
+
+    rng = np.random.default_rng(seed)
+    ys = rng.integers(0, height - dy, size=n_pairs)
+    xs = rng.integers(0, width - dx, size=n_pairs)
+    first = ys * width + xs
+    second = first + dy * width + dx
+
+    px = _as_u8(rgb_bytes)
+    gx = _gray_at(px, first)
+    gy = _gray_at(px, second)
+
+    xf = gx.astype(np.float64)
+    yf = gy.astype(np.float64)
+    r = _corr_from_sums(
+        n_pairs,
+        float(xf.sum()), float(yf.sum()),
+        float(xf @ xf), float(yf @ yf),
+        float(xf @ yf),
+    )
+    result["estimate"] = r
+    result["x"] = gx.tolist()
+    result["y"] = gy.tolist()
+
+    if n_pairs > 3 and not math.isnan(r):
+        z_crit = NormalDist().inv_cdf((1.0 + confidence) / 2.0)
+        z = math.atanh(max(min(r, 1.0 - 1e-15), -1.0 + 1e-15))
+        half = z_crit / math.sqrt(n_pairs - 3)
+        result["ci_low"] = math.tanh(z - half)
+        result["ci_high"] = math.tanh(z + half)
+    return result
 
 
 # ================== NPCR и UACI ==================
+# Большие буферы обрабатываются блоками по _BLOCK байт, чтобы временные
+# массивы не росли вместе с изображением. Счётчики целые, поэтому
+# результат совпадает с побайтовым циклом.
 
-def npcr_uaci(a: bytes, b: bytes):
-    if len(a) != len(b):
-        raise ValueError("NPCR/UACI: размеры не совпадают.")
-    n = len(a)
+_BLOCK = 1 << 22
+
+# Число единичных битов для каждого значения байта
+_POPCOUNT = np.array([bin(v).count("1") for v in range(256)], dtype=np.int64)
+
+
+def _npcr_uaci_counts(a, b) -> tuple[int, int]:
+    xa, xb = _as_u8(a), _as_u8(b)
     diff = 0
     acc_abs = 0
-    for i in range(n):
-        if a[i] != b[i]:
-            diff += 1
-        acc_abs += abs(a[i] - b[i])
+    for lo in range(0, xa.size, _BLOCK):
+        ba = xa[lo:lo + _BLOCK].astype(np.int16)
+        bb = xb[lo:lo + _BLOCK].astype(np.int16)
+        d = np.abs(ba - bb)
+        diff += int(np.count_nonzero(d))
+        acc_abs += int(d.sum(dtype=np.int64))
+    return diff, acc_abs
+
+
+def npcr_uaci(a: bytes, b: bytes):
+    if memoryview(a).nbytes != memoryview(b).nbytes:
+        raise ValueError("NPCR/UACI: размеры не совпадают.")
+    n = memoryview(a).nbytes
+    diff, acc_abs = _npcr_uaci_counts(a, b)
     NPCR = diff / n * 100.0
     UACI = acc_abs / (255.0 * n) * 100.0
     return NPCR, UACI
@@ -152,17 +463,223 @@ def key_sensitivity(cipher_a: bytes, cipher_b: bytes):
     return npcr_uaci(cipher_a, cipher_b)
 
 
+def _diff_bits(a, b) -> int:
+    xa, xb = _as_u8(a), _as_u8(b)
+    counts = np.zeros(256, dtype=np.int64)
+    for lo in range(0, xa.size, _BLOCK):
+        v = np.bitwise_xor(xa[lo:lo + _BLOCK], xb[lo:lo + _BLOCK])
+        counts += np.bincount(v, minlength=256)
+    return int(counts @ _POPCOUNT)
+
+
 def bit_avalanche(cipher_a: bytes, cipher_b: bytes) -> float:
 
-    if len(cipher_a) != len(cipher_b):
+    if memoryview(cipher_a).nbytes != memoryview(cipher_b).nbytes:
         raise ValueError("bit_avalanche: длины шифртекстов не совпадают.")
-    total_bits = len(cipher_a) * 8
+    total_bits = memoryview(cipher_a).nbytes * 8
     if total_bits == 0:
         return float("nan")
 
-    diff_bits = 0
-    for x, y in zip(cipher_a, cipher_b):
-        v = x ^ y
-        diff_bits += v.bit_count()
+    diff_bits = _diff_bits(cipher_a, cipher_b)
 
     return diff_bits / total_bits * 100.0
+
+
+# ================== Накопители для потоковой обработки ==================
+# update(chunk) - добавить очередной кусок, merge(other) - объединить с
+# накопителем другого процесса/полосы, result() - итоговая метрика.
+# Все счётчики целые, поэтому результат совпадает с расчётом по всему
+# буферу сразу.
+
+class EntropyAccumulator:
+
+    __slots__ = ("counts",)
+
+    def __init__(self) -> None:
+        self.counts = np.zeros(256, dtype=np.int64)
+
+    def update(self, chunk) -> None:
+        self.counts += np.bincount(_as_u8(chunk), minlength=256)
+
+    def merge(self, other: "EntropyAccumulator") -> "EntropyAccumulator":
+        self.counts += other.counts
+        return self
+
+    def result(self) -> float:
+        return _entropy_from_counts(self.counts.tolist(), int(self.counts.sum()))
+
+
+class NpcrUaciAccumulator:
+
+    __slots__ = ("n", "diff", "acc_abs")
+
+    def __init__(self) -> None:
+        self.n = 0
+        self.diff = 0
+        self.acc_abs = 0
+
+    def update(self, chunk_a, chunk_b) -> None:
+        if memoryview(chunk_a).nbytes != memoryview(chunk_b).nbytes:
+            raise ValueError("NPCR/UACI: размеры не совпадают.")
+        diff, acc_abs = _npcr_uaci_counts(chunk_a, chunk_b)
+        self.n += memoryview(chunk_a).nbytes
+        self.diff += diff
+        self.acc_abs += acc_abs
+
+    def merge(self, other: "NpcrUaciAccumulator") -> "NpcrUaciAccumulator":
+        self.n += other.n
+        self.diff += other.diff
+        self.acc_abs += other.acc_abs
+        return self
+
+    def result(self):
+        NPCR = self.diff / self.n * 100.0
+        UACI = self.acc_abs / (255.0 * self.n) * 100.0
+        return NPCR, UACI
+
+
+def _pair_sums(x: np.ndarray, y: np.ndarray) -> list[int]:
+    # [n, sum_x, sum_y, sum_x2, sum_y2, sum_xy] для матриц одинаковой формы
+    if x.size == 0:
+        return [0] * 6
+    xf = x.astype(np.float64)
+    yf = y.astype(np.float64)
+    return [
+        int(x.size),
+        int(xf.sum()),
+        int(yf.sum()),
+        int(np.einsum("ij,ij->", xf, xf)),
+        int(np.einsum("ij,ij->", yf, yf)),
+        int(np.einsum("ij,ij->", xf, yf)),
+    ]
+
+
+class CorrAccumulator:
+    """Суммы _corr_from_pairs по яркости для трёх направлений сразу.
+
+    Куски - байты RGB произвольной длины в порядке строк. Неполная строка
+    ждёт следующего update(). Первая и последняя строки полосы хранятся,
+    чтобы merge() досчитал вертикальные и диагональные пары на стыке полос.
+    """
+
+    __slots__ = ("width", "sums", "first_row", "last_row", "_pending")
+
+    def __init__(self, width: int) -> None:
+        if width < 1:
+            raise ValueError(f"width must be >= 1, got {width}")
+        self.width = width
+        self.sums = {d: [0] * 6 for d in _DIRECTIONS}
+        self.first_row = None
+        self.last_row = None
+        self._pending = b""
+
+    def _add(self, direction: str, part: list[int]) -> None:
+        acc = self.sums[direction]
+        for i, v in enumerate(part):
+            acc[i] += v
+
+    def _add_rows(self, rows: np.ndarray) -> None:
+        # rows - яркость (k, width); пары внутри rows и со строкой last_row
+        w = self.width
+        if w >= 2:
+            self._add("horizontal", _pair_sums(rows[:, :-1], rows[:, 1:]))
+        block = rows if self.last_row is None else np.vstack([self.last_row, rows])
+        self._add("vertical", _pair_sums(block[:-1, :], block[1:, :]))
+        if w >= 2:
+            self._add("diagonal", _pair_sums(block[:-1, :-1], block[1:, 1:]))
+        if self.first_row is None:
+            self.first_row = rows[0].copy()
+        self.last_row = rows[-1].copy()
+
+    def update(self, chunk) -> None:
+        row_bytes = self.width * 3
+        data = self._pending + bytes(chunk) if self._pending else chunk
+        n_full = memoryview(data).nbytes // row_bytes * row_bytes
+        self._pending = bytes(memoryview(data)[n_full:])
+        if n_full == 0:
+            return
+        k = n_full // row_bytes
+        rows = _gray_array(memoryview(data)[:n_full], self.width, k)
+        self._add_rows(rows)
+
+    def merge(self, other: "CorrAccumulator") -> "CorrAccumulator":
+        """Присоединяет полосу other, идущую сразу под этой."""
+        if other.width != self.width:
+            raise ValueError("CorrAccumulator.merge: different widths")
+        if self._pending or other._pending:
+            raise ValueError("CorrAccumulator.merge: incomplete row pending")
+        if other.first_row is None:
+            return self
+        if self.first_row is None:
+            self.sums = {d: list(v) for d, v in other.sums.items()}
+            self.first_row, self.last_row = other.first_row, other.last_row
+            return self
+        for d in _DIRECTIONS:
+            self._add(d, other.sums[d])
+        top = self.last_row[np.newaxis, :]
+        bottom = other.first_row[np.newaxis, :]
+        self._add("vertical", _pair_sums(top, bottom))
+        if self.width >= 2:
+            self._add("diagonal", _pair_sums(top[:, :-1], bottom[:, 1:]))
+        self.last_row = other.last_row
+        return self
+
+    def result(self) -> dict:
+        if self._pending:
+            raise ValueError("CorrAccumulator.result: incomplete row pending")
+        return {d: _corr_from_sums(*(float(v) for v in s)) for d, s in self.sums.items()}
+
+
+# ================== Анализ по полосам строк ==================
+# Для больших изображений при ограничении памяти: те же метрики, что у
+# analyze_image / local_entropy_maps, но временные массивы размером с полосу
+# strip_rows строк, а не со всё изображение. Полные корреляции считаются
+# только по яркости (CorrAccumulator).
+
+def analyze_image_strips(rgb_bytes, width: int, height: int, strip_rows: int, correlations: bool = True) -> dict:
+    if memoryview(rgb_bytes).nbytes != width * height * 3:
+        raise ValueError(
+            f"rgb_bytes size ({memoryview(rgb_bytes).nbytes}) != width*height*3 ({width*height*3})"
+        )
+    px = _as_u8(rgb_bytes)
+    row_bytes = width * 3
+    strip_rows = max(1, strip_rows)
+    hists = np.zeros((3, 256), dtype=np.int64)
+    corr_acc = CorrAccumulator(width) if correlations and width > 0 else None
+    for y0 in range(0, height, strip_rows):
+        strip = px[y0 * row_bytes:min(y0 + strip_rows, height) * row_bytes]
+        cols = strip.reshape(-1, 3)
+        for c in range(3):
+            hists[c] += np.bincount(cols[:, c], minlength=256)
+        if corr_acc is not None:
+            corr_acc.update(strip)
+
+    result = {
+        "entropy": _entropy_from_counts(hists.sum(axis=0).tolist(), int(hists.sum())),
+        "histograms": {name: hists[c].tolist() for c, name in enumerate(("R", "G", "B"))},
+    }
+    if corr_acc is not None:
+        result["corr"] = {"luma": corr_acc.result()}
+    return result
+
+
+def local_entropy_maps_strips(rgb_bytes, width: int, height: int, tile_sizes, strip_rows: int) -> dict:
+    """local_entropy_maps по полосам; высота полосы округляется до НОК размеров плиток."""
+    tile_sizes = sorted(set(int(k) for k in tile_sizes))
+    step = 1
+    for k in tile_sizes:
+        step = step * k // math.gcd(step, k)
+    strip_rows = max(step, strip_rows // step * step)
+
+    px = _as_u8(rgb_bytes)
+    row_bytes = width * 3
+    parts = {k: [] for k in tile_sizes}
+    for y0 in range(0, height - height % tile_sizes[0], strip_rows):
+        rows = min(strip_rows, height - y0)
+        strip = px[y0 * row_bytes:(y0 + rows) * row_bytes]
+        for k, m in local_entropy_maps(strip, width, rows, tile_sizes).items():
+            parts[k].append(m)
+    return {
+        k: np.concatenate(parts[k], axis=1) if parts[k] else np.zeros((3, height // k, width // k))
+        for k in tile_sizes
+    }
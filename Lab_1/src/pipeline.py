@@ -0,0 +1,641 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import hashlib
+import os
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait
+from dataclasses import dataclass, fields, replace
+from pathlib import Path
+from typing import Any, Dict, Iterable, List
+
+from artifacts import ArtifactWriter
+from backends import *
+from resultcache import ResultCache, pixels_digest
+from metrics import *
+from sensitivity import *
+from stages import StageTimer, profile_call
+from utils import *
+from verify import VERIFY_POLICIES, verify_hash, verify_sample
+
+
+# ========== Конвейер обработки одного изображения ==========
+# Исходное изображение декодируется и анализируется один раз (SourceImage),
+# затем по очереди прогоняется через выбранные шифры из BACKENDS.
+# На стороне шифртекста работа растёт с числом шифров, на стороне
+# открытого текста - нет.
+
+@dataclass
+class RunOptions:
+    workers: int = 1                     # потоки/процессы внутри шифра
+    sweep_bits: list[int] | None = None  # биты ключа для key_sensitivity_sweep
+    sweep_workers: int | None = None     # процессы для key_sensitivity_sweep
+    corr_sample: int | None = None       # число пар для выборочной корреляции
+    corr_seed: int = 0
+    local_entropy_tiles: tuple = (32,)   # размеры плиток локальной энтропии, () - выкл.
+    local_entropy_threshold: float = 7.0
+    writer: ArtifactWriter | None = None  # фоновая запись файлов, None - синхронно
+    image_format: str = "png"            # формат шифртекста: png | raw | npy
+    compress_level: int | None = None    # уровень zlib для PNG, None - по умолчанию
+    save_decrypted: bool = True          # сохранять ли *_dec (проверка идёт в памяти)
+    result_cache: ResultCache | None = None  # пропуск неизменившихся пар, None - выкл.
+    verify: str = "full"                 # проверка обратимости: full | hash | sample | off
+    verify_rows: int = 16                # строк для verify="sample"
+    verify_seed: int = 0
+    profile: bool = False                # cProfile каждой задачи в results/profile/
+    trace_memory: bool = False           # tracemalloc по стадиям
+    memory_budget: int | None = None     # байт на задачу; больше - потоковый режим
+
+
+# Поля RunOptions, не влияющие на содержимое summary
+_NON_RESULT_FIELDS = {"workers", "sweep_workers", "writer", "result_cache", "profile", "trace_memory"}
+
+
+def job_option_fields() -> frozenset:
+    """Имена полей RunOptions, от которых зависит результат (их задаёт задача --serve)."""
+    return frozenset(f.name for f in fields(RunOptions)) - _NON_RESULT_FIELDS
+
+
+# ========== Бюджет памяти ==========
+# Пик памяти задачи (замер tracemalloc на 1024x1024 .. 4096x2048): в памяти
+# одновременно живут rgb, enc, dec, enc_bad и временные массивы analyze_image
+# (яркость во float64, индексы bincount) - около 11 байт на байт изображения
+# плюс постоянная часть: блоки int16 в npcr_uaci, полосы плиток локальной
+# энтропии (не больше ~30 МБ при любых --local-entropy-tiles). В потоковом
+# режиме остаются rgb, enc и копии при шифровании целиком (до 4n у XOR)
+# плюс несколько кусков.
+_FOOTPRINT_IN_MEMORY = 11.0
+_FOOTPRINT_FIXED = 24 << 20
+_FOOTPRINT_STREAMING = 4.0
+_FOOTPRINT_CHUNKS = 8.0
+_MIN_CHUNK = 1 << 20
+
+
+def memory_plan(n_bytes: int, width: int, opts: RunOptions) -> dict:
+    """Режим обработки задачи с учётом opts.memory_budget.
+
+    mode "streaming": проверка обратимости по хэшу вместо полного
+    расшифрования, анализ и локальная энтропия по полосам строк,
+    чувствительность к ключу потоком. Полные корреляции - только по яркости.
+    """
+    projected = int(n_bytes * _FOOTPRINT_IN_MEMORY) + _FOOTPRINT_FIXED
+    plan = {
+        "budget_mb": None, "projected_mb": projected / (1 << 20), "mode": "in-memory",
+        "strip_rows": None, "chunk_bytes": None,
+    }
+    budget = opts.memory_budget
+    if budget is None:
+        return plan
+    plan["budget_mb"] = budget / (1 << 20)
+    if projected <= budget:
+        return plan
+    # Остаток бюджета после rgb и enc делится на временные буферы полос;
+    # кусок кратен 4 КиБ, чтобы ECB/CBC не копили неполный блок
+    spare = budget - n_bytes * _FOOTPRINT_STREAMING
+    chunk = max(_MIN_CHUNK, int(spare / _FOOTPRINT_CHUNKS) >> 12 << 12)
+    plan.update(
+        mode="streaming",
+        projected_mb=(n_bytes * _FOOTPRINT_STREAMING + chunk * _FOOTPRINT_CHUNKS) / (1 << 20),
+        strip_rows=max(1, chunk // max(width * 3, 1)),
+        chunk_bytes=chunk,
+    )
+    return plan
+
+
+def _npcr_uaci_chunked(a, b, chunk: int):
+    va, vb = memoryview(a).cast("B"), memoryview(b).cast("B")
+    acc = NpcrUaciAccumulator()
+    for off in range(0, va.nbytes, chunk):
+        acc.update(va[off:off + chunk], vb[off:off + chunk])
+    return acc.result()
+
+
+def _key_sensitivity_streaming(backend: CipherBackend, rgb, enc, bad_key: bytes, nonce, chunk: int):
+    # Шифртекст с изменённым ключом не собирается целиком: кусками через
+    # поточный объект, NPCR/UACI - накопителем
+    src, ref = memoryview(rgb).cast("B"), memoryview(enc).cast("B")
+    stream = new_stream_cipher(backend.name, bad_key, nonce)
+    acc = NpcrUaciAccumulator()
+    for off in range(0, src.nbytes, chunk):
+        acc.update(ref[off:off + chunk], stream.update(src[off:off + chunk]))
+    stream.finalize()
+    return acc.result()
+
+
+def _result_params(opts: RunOptions) -> dict:
+    return {f.name: getattr(opts, f.name) for f in fields(opts) if f.name not in _NON_RESULT_FIELDS}
+
+
+def _emit(opts: RunOptions, fn, *args, **kwargs):
+    # Запись артефакта: в фоне, если задан writer, иначе сразу.
+    # Возвращает Future фоновой задачи или None
+    if opts.writer is None:
+        fn(*args, **kwargs)
+        return None
+    return opts.writer.submit(fn, *args, **kwargs)
+
+
+def _timed_save(io: dict, timer: StageTimer, name: str, rgb, w: int, h: int, path: str, opts: RunOptions) -> None:
+    t0 = time.perf_counter()
+    save_image(rgb, w, h, path, opts.image_format, opts.compress_level)
+    io[f"{name}_write_s"] = time.perf_counter() - t0
+    io[f"{name}_bytes"] = os.path.getsize(path)
+    timer.add(f"save_{name}", io[f"{name}_write_s"])
+
+
+def _emit_timed(opts: RunOptions, timer: StageTimer, pending: list, name: str, fn, *args, **kwargs) -> None:
+    # Фоновая запись со стадией name; Future - в pending, чтобы metrics.json её дождался
+    pending.append(_emit(opts, timer.timed, name, fn, *args, **kwargs))
+
+
+def _write_metrics_after(path: str, summary: dict, futures, cache=None, job_key=None, files=()) -> None:
+    # JSON с метриками пишется после картинок, чтобы в нём были их тайминги;
+    # в кэш результатов - только когда files (шифртекст, meta) уже на диске
+    wait([f for f in futures if f is not None])
+    summary["stages"] = dict(summary["stages"])
+    write_metrics_json(path, summary)
+    if cache is not None:
+        cache.put(job_key, summary, [*files, path])
+
+
+def _analyze(
+    rgb, w: int, h: int, opts: RunOptions, out_stem: str, kind: str, title: str,
+    timer: StageTimer, pending: list, strip_rows: int | None = None,
+):
+    """analyze_image + локальная энтропия + (при corr_sample) выборочные корреляции.
+
+    strip_rows - считать по полосам строк (потоковый режим memory_plan).
+    Картинки пишутся в results/{out_stem}_*_{kind}.png.
+    Возвращает (analysis, горизонтальная корреляция по яркости).
+    """
+    def analyze(correlations: bool) -> dict:
+        if strip_rows:
+            return analyze_image_strips(rgb, w, h, strip_rows, correlations)
+        return analyze_image(rgb, w, h, correlations)
+
+    if opts.corr_sample is None:
+        # Энтропия, гистограммы и все корреляции - один проход
+        with timer.stage("analyze"):
+            analysis = analyze(True)
+        corr = analysis["corr"]["luma"]["horizontal"]
+    else:
+        # Полные корреляции O(W*H) не считаем - только выборка
+        with timer.stage("analyze"):
+            analysis = analyze(False)
+        sampled = {}
+        with timer.stage("corr_sampled"):
+            for direction in ("horizontal", "vertical", "diagonal"):
+                res = corr_adjacent_sampled(rgb, w, h, direction, opts.corr_sample, opts.corr_seed)
+                if direction == "horizontal":
+                    _emit_timed(
+                        opts, timer, pending, "scatter_png", scatter_png,
+                        res["x"], res["y"], f"results/{out_stem}_scatter_{kind}.png", title,
+                    )
+                sampled[direction] = {k: res[k] for k in ("estimate", "ci_low", "ci_high", "n_pairs")}
+        analysis["corr_sampled"] = sampled
+        corr = sampled["horizontal"]["estimate"]
+
+    if opts.local_entropy_tiles:
+        local = {}
+        with timer.stage("local_entropy"):
+            if strip_rows:
+                maps = local_entropy_maps_strips(rgb, w, h, opts.local_entropy_tiles, strip_rows)
+            else:
+                maps = local_entropy_maps(rgb, w, h, opts.local_entropy_tiles)
+        for k, tile_map in maps.items():
+            local[str(k)] = local_entropy_stats(tile_map, opts.local_entropy_threshold)
+            if tile_map.size:
+                _emit_timed(
+                    opts, timer, pending, "entropy_heatmap_png", entropy_heatmap_png,
+                    tile_map, f"results/{out_stem}_local_entropy_{k}_{kind}.png",
+                    f"{title} local H, {k}x{k}",
+                )
+        analysis["local_entropy"] = local
+    return analysis, corr
+
+
+def _corr_fields(analysis: dict, suffix: str) -> dict:
+    if "corr" in analysis:
+        fields = {f"corr_{suffix}_all": analysis["corr"]}
+    else:
+        fields = {f"corr_{suffix}_sampled": analysis["corr_sampled"]}
+    if "local_entropy" in analysis:
+        fields[f"local_entropy_{suffix}"] = analysis["local_entropy"]
+    return fields
+
+
+class SourceImage:
+
+    __slots__ = (
+        "path", "stem", "rgb", "w", "h", "analysis", "entropy", "corr", "hist_path",
+        "timer", "pending", "plan", "_sha256", "_scratch",
+    )
+
+    def __init__(
+        self,
+        input_path: str,
+        opts: RunOptions | None = None,
+        loaded=None,
+        timer: StageTimer | None = None,
+    ) -> None:
+        # loaded - уже загруженные (rgb, w, h), чтобы не декодировать дважды;
+        # timer - стадии исходника (в нём может уже быть время load_image)
+        opts = opts or RunOptions()
+        self.path = input_path
+        self.stem = Path(input_path).stem
+        self.timer = timer or StageTimer(opts.trace_memory)
+        self.pending: list = []  # фоновые записи исходника
+        if loaded is None:
+            loaded = self.timer.timed("load_image", load_image, input_path)
+        self.rgb, self.w, self.h = loaded
+        self.plan = memory_plan(memoryview(self.rgb).nbytes, self.w, opts)
+        if self.plan["budget_mb"] is not None and self.plan["projected_mb"] > self.plan["budget_mb"]:
+            print(
+                f"[WARN] {input_path}: ~{self.plan['projected_mb']:.0f} MB даже в потоковом режиме "
+                f"(бюджет {self.plan['budget_mb']:.0f} MB)"
+            )
+
+        self.analysis, self.corr = _analyze(
+            self.rgb, self.w, self.h, opts, self.stem, "src", f"{self.stem} source",
+            self.timer, self.pending, self.plan["strip_rows"],
+        )
+        self.entropy = self.analysis["entropy"]
+
+        self.hist_path = f"results/{self.stem}_hist_src.png"
+        _emit_timed(
+            opts, self.timer, self.pending, "histogram_png", histogram_png,
+            self.rgb, self.w, self.h, self.hist_path, f"{self.stem} source",
+            hists=self.analysis["histograms"],
+        )
+        self._sha256 = None
+        self._scratch = None
+
+    def scratch(self) -> bytearray:
+        """Рабочий буфер размера изображения, общий для шифров этого исходника
+        (шифры идут по очереди): шифртекст с изменённым ключом пишется через
+        output= в одно и то же место, без нового буфера на каждый шифр.
+        """
+        if self._scratch is None:
+            self._scratch = bytearray(memoryview(self.rgb).nbytes)
+        return self._scratch
+
+    def sha256(self) -> bytes:
+        # Считается один раз на изображение и только для verify="hash"
+        if self._sha256 is None:
+            self._sha256 = hashlib.sha256(memoryview(self.rgb).cast("B")).digest()
+        return self._sha256
+
+
+def _verify(src: SourceImage, backend: CipherBackend, enc, key: bytes, nonce, tag, opts: RunOptions):
+    """Проверка обратимости по opts.verify -> (dec или None, время расшифрования, отчёт)."""
+    policy = opts.verify
+    if policy == "full" and src.plan["mode"] == "streaming":
+        # Полный dec не помещается в бюджет - сравниваем SHA-256 потоком
+        policy = "hash"
+    if policy not in VERIFY_POLICIES:
+        raise ValueError(f"Unknown verify policy: {policy}")
+    report = {"policy": policy}
+    dec = None
+    decrypt_s = None
+
+    t0 = time.perf_counter()
+    if policy == "full":
+        if backend.tag_size:
+            dec = backend.decrypt_and_verify(enc, key, nonce, tag, opts.workers)
+        else:
+            dec = backend.decrypt(enc, key, nonce, opts.workers)
+        decrypt_s = time.perf_counter() - t0
+        report.update(ok=src.rgb == dec, bytes_checked=len(dec))
+    elif policy == "hash":
+        report.update(verify_hash(backend, src.sha256(), enc, key, nonce, tag))
+        decrypt_s = time.perf_counter() - t0
+    elif policy == "sample":
+        report.update(verify_sample(
+            backend, src.rgb, enc, key, nonce, src.w, src.h, opts.verify_rows, opts.verify_seed,
+        ))
+    report["seconds"] = time.perf_counter() - t0
+    return dec, decrypt_s, report
+
+
+def run_backend(
+    src: SourceImage,
+    backend: CipherBackend,
+    key: bytes,
+    opts: RunOptions | None = None,
+    job_key: str | None = None,
+) -> Dict[str, Any]:
+    opts = opts or RunOptions()
+    workers = opts.workers
+    nonce = backend.new_nonce()
+    rgb, w, h, stem = src.rgb, src.w, src.h, src.stem
+    timer = StageTimer(opts.trace_memory)
+    pending: list = []  # фоновые записи этой задачи
+    streaming = src.plan["mode"] == "streaming"
+
+    tag = None
+    with timer.stage("encrypt"):
+        t0 = time.perf_counter()
+        if backend.tag_size:
+            enc, tag = backend.encrypt_and_digest(rgb, key, nonce, workers)
+        else:
+            enc = backend.encrypt(rgb, key, nonce, workers)
+        encrypt_s = time.perf_counter() - t0
+    with timer.stage("verify"):
+        dec, decrypt_s, verify_report = _verify(src, backend, enc, key, nonce, tag, opts)
+
+    ext = IMAGE_FORMATS[opts.image_format]
+    out_img = f"imgs/{stem}_{backend.name}{ext}"
+    dec_img = f"imgs/{stem}_{backend.name}_dec{ext}"
+    meta_path = f"results/{stem}_{backend.name}_meta.json"
+
+    io = {"format": opts.image_format, "compress_level": opts.compress_level}
+    pending.append(_emit(opts, _timed_save, io, timer, "enc", enc, w, h, out_img, opts))
+    if opts.save_decrypted and dec is not None:
+        pending.append(_emit(opts, _timed_save, io, timer, "dec", dec, w, h, dec_img, opts))
+
+    _emit_timed(
+        opts, timer, pending, "write_meta", write_meta,
+        meta_path,
+        backend.name,
+        key,
+        src.path,
+        out_img,
+        nonce,
+        tag,
+    )
+
+    analysis_enc, corr_enc = _analyze(
+        enc, w, h, opts, f"{stem}_{backend.name}", "enc", f"{stem} {backend.label} enc",
+        timer, pending, src.plan["strip_rows"],
+    )
+    ent_enc = analysis_enc["entropy"]
+
+    # NPCR/UACI между исходником и шифром
+    with timer.stage("npcr_uaci"):
+        if streaming:
+            npcr, uaci = _npcr_uaci_chunked(rgb, enc, src.plan["chunk_bytes"])
+        else:
+            npcr, uaci = npcr_uaci(rgb, enc)
+
+    # Чувствительность к ключу: меняем 1 бит ключа
+    with timer.stage("key_sensitivity"):
+        bad_key = bytes([key[0] ^ 1]) + key[1:]
+        if streaming:
+            npcr_k, uaci_k = _key_sensitivity_streaming(
+                backend, rgb, enc, bad_key, nonce, src.plan["chunk_bytes"],
+            )
+        else:
+            with keystream_cache_bypass():
+                enc_bad = backend.encrypt(rgb, bad_key, nonce, workers, output=src.scratch())
+            npcr_k, uaci_k = key_sensitivity(enc, enc_bad)
+
+    _emit_timed(
+        opts, timer, pending, "histogram_png", histogram_png,
+        enc, w, h,
+        f"results/{stem}_{backend.name}_hist_enc.png",
+        f"{stem} {backend.label} enc",
+        hists=analysis_enc["histograms"],
+    )
+
+    # Проверка побитовой обратимости (полная, по хэшу или по выборке строк)
+    if verify_report.get("ok") is False:
+        raise AssertionError(
+            f"{backend.label}: дешифрование не восстановило исходник ({verify_report['policy']})"
+        )
+
+    summary = {
+        "algo": backend.name,
+        "input": src.path,
+        "output": out_img,
+    }
+    if backend.nonce_field:
+        summary[backend.nonce_field] = nonce.hex()
+    if tag is not None:
+        summary["tag_hex"] = tag.hex()
+    size_mb = len(rgb) / (1 << 20)
+    summary.update({
+        "encrypt_mb_s": size_mb / max(encrypt_s, 1e-9),
+        # Полное расшифрование есть только при verify full/hash
+        "decrypt_mb_s": size_mb / max(decrypt_s, 1e-9) if decrypt_s is not None else None,
+        "verify": verify_report,
+        "entropy_src": src.entropy,
+        "entropy_enc": ent_enc,
+        "corr_src": src.corr,
+        "corr_enc": corr_enc,
+        "NPCR_src_vs_enc": npcr,
+        "UACI_src_vs_enc": uaci,
+        "KeySensitivity_NPCR": npcr_k,
+        "KeySensitivity_UACI": uaci_k,
+        "hist_src": src.hist_path,
+        "io": io,
+    })
+    summary.update(_corr_fields(src.analysis, "src"))
+    summary.update(_corr_fields(analysis_enc, "enc"))
+    if opts.sweep_bits:
+        with timer.stage("key_sweep"):
+            summary["KeySensitivity_sweep"] = key_sensitivity_sweep(
+                rgb, backend.name, key, nonce, opts.sweep_bits,
+                ref_enc=enc, workers=opts.sweep_workers,
+            )
+    # Время фоновых стадий попадёт в словари после завершения записей
+    summary["stages"] = timer.seconds
+    summary["stages_src"] = src.timer.seconds
+    summary["memory"] = src.plan
+    if opts.trace_memory:
+        summary["stages_memory"] = timer.memory
+        summary["stages_src_memory"] = src.timer.memory
+    _emit(
+        opts, _write_metrics_after,
+        f"results/{stem}_{backend.name}_metrics.json", dict(summary), pending + src.pending,
+        opts.result_cache if job_key else None, job_key, (out_img, meta_path),
+    )
+
+    note = f" ({backend.nonce_field.removesuffix('_hex')}: {nonce.hex()})" if nonce else ""
+    print(f"[OK] {backend.label}: {src.path} -> {out_img}{note}")
+    return summary
+
+
+def _run_job(src, backend, key, opts, job_key):
+    if opts.profile:
+        return profile_call(
+            f"results/profile/{src.stem}_{backend.name}",
+            run_backend, src, backend, key, opts, job_key,
+        )
+    return run_backend(src, backend, key, opts, job_key)
+
+
+def _run_one(src, backend, key, opts, job_key, input_path, errors):
+    # errors - список для ошибок отдельных пар; None - исключение наружу
+    if errors is None:
+        return _run_job(src, backend, key, opts, job_key)
+    try:
+        return _run_job(src, backend, key, opts, job_key)
+    except Exception as exc:
+        errors.append({"input": input_path, "algo": backend.name, "error": f"{type(exc).__name__}: {exc}"})
+        print(f"[FAIL] {backend.label}: {input_path}: {exc}")
+        return None
+
+
+def run_image(
+    input_path: str,
+    algos: Iterable[str],
+    key: bytes,
+    opts: RunOptions | None = None,
+    errors: list | None = None,
+) -> List[Dict[str, Any]]:
+    """Прогон одного изображения через шифры algos.
+
+    Если передан список errors, сбой одного шифра не прерывает остальные:
+    ошибка добавляется в errors, а строки summary для этой пары нет.
+    Если не загрузился или не проанализировался сам исходник, в errors -
+    одна ошибка с "algo": None, и оставшиеся шифры изображения пропускаются.
+    """
+    opts = opts or RunOptions()
+    cache = opts.result_cache
+    loaded = None
+    src = None
+    src_timer = StageTimer(opts.trace_memory)
+
+    def source() -> SourceImage | None:
+        # Исходник готовится один раз, при первой паре, которой он нужен
+        nonlocal src
+        if src is None:
+            try:
+                src = SourceImage(input_path, opts, loaded, src_timer)
+            except Exception as exc:
+                if errors is None:
+                    raise
+                errors.append({"input": input_path, "algo": None, "error": f"{type(exc).__name__}: {exc}"})
+                print(f"[FAIL] {input_path}: {exc}")
+                return None
+        return src
+
+    rows = []
+    if cache is None:
+        for algo in algos:
+            if source() is None:
+                break
+            summary = _run_one(src, get_backend(algo), key, opts, None, input_path, errors)
+            if summary is not None:
+                rows.append(summary)
+        return rows
+
+    # Сначала ищем готовые результаты; исходник анализируется, только
+    # если хотя бы одна пара изменилась
+    loaded = src_timer.timed("load_image", load_image, input_path)
+    pixels_sha = src_timer.timed("pixels_digest", pixels_digest, *loaded)
+    params = _result_params(opts)
+    for algo in algos:
+        backend = get_backend(algo)
+        job_key = cache.job_key(pixels_sha, backend.name, key, params)
+        summary = cache.get(job_key)
+        if summary is not None:
+            # Путь к входу мог измениться при том же содержимом
+            summary["input"] = input_path
+            summary["cached"] = True
+            print(f"[CACHE] {backend.label}: {input_path} -> {summary['output']}")
+        elif source() is None:
+            break
+        else:
+            summary = _run_one(src, backend, key, opts, job_key, input_path, errors)
+        if summary is not None:
+            rows.append(summary)
+    return rows
+
+
+# ========== Сетка изображения x шифры ==========
+# При jobs > 1 каждое изображение - отдельная задача пула процессов: исходник
+# анализируется один раз на изображение, как и при последовательном прогоне.
+# У процесса свой ArtifactWriter, файлы дописываются до возврата результата.
+# Порядок строк не зависит от порядка завершения задач.
+
+def normalize_key(text: str) -> bytes:
+    """Ключ из строки: UTF-8, дополняется нулями или обрезается до 16 байт (AES-128)."""
+    return text.encode("utf-8").ljust(16, b"\0")[:16]
+
+
+def resolve_input(path: str) -> str:
+    """Путь как есть, а если такого файла нет - imgs/<path>."""
+    return path if Path(path).exists() else "imgs/" + path
+
+
+def run_image_job(input_path: str, algos: list, key: bytes, opts: RunOptions, write_workers: int):
+    """Одно изображение в процессе пула: (rows, errors, (hits, misses) кэша результатов).
+
+    Пишет файлы своим ArtifactWriter и дожидается их; сбой изображения
+    целиком - одна ошибка с "algo": None, исключение наружу не выходит.
+    """
+    errors: list = []
+    rows: list = []
+    if opts.trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    try:
+        with ArtifactWriter(write_workers) as writer:
+            rows = run_image(input_path, algos, key, replace(opts, writer=writer), errors)
+    except Exception as exc:
+        errors.append({"input": input_path, "algo": None, "error": f"{type(exc).__name__}: {exc}"})
+    cache = opts.result_cache
+    cache_counts = (cache.hits, cache.misses) if cache is not None else (0, 0)
+    return rows, errors, cache_counts
+
+
+def run_grid(
+    inputs: Iterable[str],
+    algos: Iterable[str],
+    key: bytes,
+    opts: RunOptions,
+    jobs: int = 1,
+    write_workers: int = 2,
+):
+    """Все изображения через все шифры. Возвращает (rows, errors).
+
+    Строки идут в порядке inputs x algos; ошибки отдельных пар и
+    изображений собираются в errors и не прерывают прогон.
+    """
+    inputs = list(inputs)
+    algos = list(algos)
+    total = len(inputs)
+    results: list = [None] * total
+    errors: list = []
+
+    if jobs <= 1:
+        for i, path in enumerate(inputs):
+            errs: list = []
+            try:
+                results[i] = run_image(path, algos, key, opts, errs)
+            except Exception as exc:
+                errs.append({"input": path, "algo": None, "error": f"{type(exc).__name__}: {exc}"})
+                results[i] = []
+            errors.extend(errs)
+            _progress(i + 1, total, path, errs)
+        return [r for rows in results for r in rows], errors
+
+    # В процессы писатель файлов не передаётся - у каждого свой
+    job_opts = replace(opts, writer=None)
+    per_image_errors: list = [[] for _ in inputs]
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {
+            pool.submit(run_image_job, path, algos, key, job_opts, write_workers): i
+            for i, path in enumerate(inputs)
+        }
+        for done, fut in enumerate(as_completed(futures), 1):
+            i = futures[fut]
+            try:
+                rows, errs, (hits, misses) = fut.result()
+            except Exception as exc:  # например, процесс пула упал
+                rows, errs, hits, misses = [], [{"input": inputs[i], "algo": None, "error": repr(exc)}], 0, 0
+            results[i] = rows
+            per_image_errors[i] = errs
+            if opts.result_cache is not None:
+                opts.result_cache.hits += hits
+                opts.result_cache.misses += misses
+            _progress(done, total, inputs[i], errs)
+    for errs in per_image_errors:
+        errors.extend(errs)
+    return [r for rows in results for r in rows], errors
+
+
+def _progress(done: int, total: int, path: str, errs: list) -> None:
+    status = f"{len(errs)} failed" if errs else "ok"
+    print(f"[{done}/{total}] {path}: {status}")
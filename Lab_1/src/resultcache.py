@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Iterable
+
+
+# ========== Кэш результатов по содержимому ==========
+# Результат пары (изображение, шифр) адресуется хэшем всего, от чего он
+# зависит: sha256 пикселей и размеров, имя шифра, sha256 ключа, параметры
+# анализа и версия кода (хэш исходников src/*.py). Повторный --run-all
+# берёт summary из results/cache/ и не шифрует неизменившиеся пары.
+# Файлы пары (шифртекст, _meta.json, _metrics.json) лежат под общими именами
+# и перезаписываются прогоном с другими параметрами, поэтому запись хранит их
+# отпечатки: при расхождении это промах, и пара считается заново.
+
+_SRC_DIR = Path(__file__).resolve().parent
+
+
+def code_version() -> str:
+    """sha256 всех исходников src/*.py: любая правка кода сбрасывает кэш."""
+    h = hashlib.sha256()
+    for p in sorted(_SRC_DIR.glob("*.py")):
+        h.update(p.name.encode("utf-8"))
+        h.update(p.read_bytes())
+    return h.hexdigest()
+
+
+def file_fingerprint(path: str) -> dict:
+    st = os.stat(path)
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": h.hexdigest()}
+
+
+def _file_unchanged(path: str, fp: dict) -> bool:
+    # Размер и mtime совпали - файл тот же; mtime мог смениться при
+    # копировании, тогда решает sha256
+    try:
+        st = os.stat(path)
+    except OSError:
+        return False
+    if st.st_size != fp["size"]:
+        return False
+    if st.st_mtime_ns == fp["mtime_ns"]:
+        return True
+    return file_fingerprint(path)["sha256"] == fp["sha256"]
+
+
+def pixels_digest(rgb, w: int, h: int) -> str:
+    d = hashlib.sha256(f"{w}x{h}:".encode("ascii"))
+    d.update(memoryview(rgb).cast("B"))
+    return d.hexdigest()
+
+
+class ResultCache:
+    """summary по ключу задачи в root/<ключ[:2]>/<ключ>.json.
+
+    Запись: {"summary": ..., "files": {путь: отпечаток}}; попадание - только
+    если все файлы из "files" на месте и не изменились.
+    """
+
+    def __init__(self, root: str = "results/cache", version: str | None = None) -> None:
+        self.root = Path(root)
+        self.version = version or code_version()
+        self.hits = 0
+        self.misses = 0
+
+    def job_key(self, pixels_sha: str, algo: str, key: bytes, params: dict) -> str:
+        desc = {
+            "pixels": pixels_sha,
+            "algo": algo,
+            "key_sha256": hashlib.sha256(key).hexdigest(),
+            "params": params,
+            "code": self.version,
+        }
+        return hashlib.sha256(json.dumps(desc, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def _path(self, job_key: str) -> Path:
+        return self.root / job_key[:2] / f"{job_key}.json"
+
+    def get(self, job_key: str) -> dict | None:
+        path = self._path(job_key)
+        try:
+            entry = json.loads(path.read_text(encoding="utf-8"))
+            summary, files = entry["summary"], entry["files"]
+        except (OSError, ValueError, KeyError, TypeError):
+            self.misses += 1
+            return None
+        # Шифртекст или отчёты пары перезаписаны (другие параметры, другой
+        # вход с тем же именем) или удалены - запись не соответствует диску
+        if not files or not all(_file_unchanged(p, fp) for p, fp in files.items()):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return summary
+
+    def put(self, job_key: str, summary: dict, files: Iterable[str]) -> None:
+        """Сохранить summary; files - записанные файлы пары, уже на диске."""
+        entry = {"summary": summary, "files": {p: file_fingerprint(p) for p in files}}
+        path = self._path(job_key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(entry, indent=2), encoding="utf-8")
+        os.replace(tmp, path)
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "root": str(self.root)}
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import cProfile
+import io
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# ========== Время по стадиям конвейера ==========
+# Каждая задача (изображение x шифр) получает свой StageTimer. Стадии,
+# которые выполняются в фоне (запись PNG, гистограммы), добавляют своё время
+# из потоков ArtifactWriter, поэтому add() под замком.
+#
+# С trace_memory (и запущенным tracemalloc) для стадий основного потока
+# записываются пик выделенной памяти, прирост, RSS процесса и крупнейшие
+# места выделения. tracemalloc считает память всего процесса, поэтому
+# фоновые записи могут попасть в пик - для точных цифр --write-workers 0.
+
+_MB = float(1 << 20)
+_TOP_ALLOCS = 3
+
+
+def current_rss_mb() -> float | None:
+    """Текущий RSS (Linux, /proc), иначе пиковый из getrusage."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * resource.getpagesize() / _MB
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / _MB if sys.platform == "darwin" else peak / 1024.0
+
+
+class StageTimer:
+
+    def __init__(self, trace_memory: bool = False) -> None:
+        self.seconds: dict[str, float] = {}
+        self.memory: dict[str, dict] = {}
+        self.trace_memory = trace_memory
+        self._owner = threading.get_ident()
+        self._lock = threading.Lock()
+
+    def add(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, name: str):
+        trace = (
+            self.trace_memory
+            and tracemalloc.is_tracing()
+            and threading.get_ident() == self._owner
+        )
+        if trace:
+            snap0 = tracemalloc.take_snapshot()
+            tracemalloc.reset_peak()
+            cur0 = tracemalloc.get_traced_memory()[0]
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - t0)
+            if trace:
+                self._record_memory(name, snap0, cur0)
+
+    def _record_memory(self, name: str, snap0, cur0: int) -> None:
+        cur, peak = tracemalloc.get_traced_memory()
+        diffs = tracemalloc.take_snapshot().compare_to(snap0, "lineno")
+        top = sorted(diffs, key=lambda d: -d.size_diff)[:_TOP_ALLOCS]
+        rec = {
+            "peak_mb": (peak - cur0) / _MB,
+            "retained_mb": (cur - cur0) / _MB,
+            "rss_mb": current_rss_mb(),
+            # Крупнейшие места выделения памяти, оставшейся к концу стадии
+            "top_retained": [
+                {"where": f"{d.traceback[0].filename}:{d.traceback[0].lineno}", "size_mb": d.size_diff / _MB}
+                for d in top if d.size_diff > 0
+            ],
+        }
+        old = self.memory.get(name)
+        if old is None or rec["peak_mb"] > old["peak_mb"]:
+            self.memory[name] = rec
+
+    def timed(self, name: str, fn, *args, **kwargs):
+        with self.stage(name):
+            return fn(*args, **kwargs)
+
+
+def aggregate_stages(rows: list[dict]) -> dict:
+    """Сводная таблица по стадиям для summary_all.json.
+
+    Стадии исходника (stages_src) учитываются один раз на изображение,
+    строки из кэша результатов (cached) не учитываются.
+    """
+    samples: dict[str, list[float]] = {}
+    by_algo: dict[str, dict[str, float]] = {}
+    seen_src = set()
+    for row in rows:
+        if row.get("cached"):
+            continue
+        for name, sec in row.get("stages", {}).items():
+            samples.setdefault(name, []).append(sec)
+            algo_stages = by_algo.setdefault(row["algo"], {})
+            algo_stages[name] = algo_stages.get(name, 0.0) + sec
+        if row["input"] not in seen_src:
+            seen_src.add(row["input"])
+            for name, sec in row.get("stages_src", {}).items():
+                samples.setdefault(f"src:{name}", []).append(sec)
+
+    grand = sum(sum(v) for v in samples.values()) or 1.0
+    table = {}
+    for name, vals in sorted(samples.items(), key=lambda kv: -sum(kv[1])):
+        total = sum(vals)
+        table[name] = {
+            "total_s": total,
+            "mean_s": total / len(vals),
+            "max_s": max(vals),
+            "count": len(vals),
+            "share_pct": total / grand * 100.0,
+        }
+    return {"stages": table, "stages_by_algo": by_algo}
+
+
+def print_stage_table(table: dict, limit: int = 15) -> None:
+    for name, st in list(table.items())[:limit]:
+        print(
+            f"[stage] {name:24s} {st['total_s']:9.3f} s  {st['share_pct']:5.1f}%"
+            f"  mean {st['mean_s'] * 1000:9.2f} ms  x{st['count']}"
+        )
+
+
+# ========== cProfile по задачам ==========
+
+def profile_call(out_stem: str, fn, *args, **kwargs):
+    """fn под cProfile; пишет out_stem.prof (pstats) и out_stem.txt (топ по cumtime).
+
+    Фоновые потоки записи файлов в профиль не попадают - их время видно
+    в стадиях.
+    """
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(fn, *args, **kwargs)
+    finally:
+        Path(out_stem).parent.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(f"{out_stem}.prof")
+        text = io.StringIO()
+        pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(30)
+        Path(f"{out_stem}.txt").write_text(text.getvalue(), encoding="utf-8")
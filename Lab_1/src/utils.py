@@ -3,26 +3,115 @@ from __future__ import annotations
 from PIL import Image, ImageDraw, ImageFont
 import hashlib
 import json
+import struct
 import datetime as dt
 from pathlib import Path
 
+import numpy as np
+
+from mapped import map_file
+from metrics import channel_histograms
+
 
 # ================== Загрузка и сохранение изображений ==================
 
 def load_image(path: str):
+    # Сырые .rgb/.npy отображаются в память без декодирования (load_image_mapped)
+    if Path(path).suffix.lower() in MAPPED_SUFFIXES:
+        return load_image_mapped(path)
+    # PNG декодируется в память PIL, tobytes() - ещё одна копия
     img = Image.open(path).convert("RGB")
     w, h = img.size
     return img.tobytes(), w, h
 
 
-def save_image_rgb(rgb_bytes: bytes, w: int, h: int, out_path: str):
-    if len(rgb_bytes) != w * h * 3:
+def load_image_mapped(path: str):
+    """.rgb (RAW_HEADER + пиксели) или .npy (h, w, 3) uint8 -> (memoryview, w, h).
+
+    Буфер только для чтения и отображён из файла (см. mapped.py).
+    """
+    suffix = Path(path).suffix.lower()
+    with open(path, "rb") as f:
+        if suffix == ".rgb":
+            magic, w, h = RAW_HEADER.unpack(f.read(RAW_HEADER.size))
+            if magic != RAW_MAGIC:
+                raise ValueError(f"{path}: not a raw RGB file (magic {magic!r})")
+        elif suffix == ".npy":
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            if dtype != np.uint8 or len(shape) != 3 or shape[2] != 3 or fortran_order:
+                raise ValueError(f"{path}: expected C-ordered uint8 array (h, w, 3), got {dtype} {shape}")
+            h, w = shape[0], shape[1]
+        else:
+            raise ValueError(f"{path}: unsupported raw image type {suffix}")
+        offset = f.tell()
+
+    n = w * h * 3
+    size = Path(path).stat().st_size
+    if size - offset < n:
+        raise ValueError(f"{path}: file truncated ({size - offset} < {n} bytes of pixels)")
+    return map_file(path, offset, n), w, h
+
+
+def save_image_rgb(rgb_bytes: bytes, w: int, h: int, out_path: str, compress_level: int | None = None):
+    # rgb_bytes - любой буфер (bytes, bytearray, memoryview, массив NumPy).
+    # Для режима "RGB" frombuffer всё равно копирует пиксели (PIL хранит их
+    # как RGBX); без копии пишут только save_image_raw / save_image_npy.
+    # compress_level - уровень zlib для PNG (0 - без сжатия, None - по умолчанию)
+    _check_rgb_size(rgb_bytes, w, h)
+    img = Image.frombuffer("RGB", (w, h), rgb_bytes, "raw", "RGB", 0, 1)
+    Path(out_path).parent.mkdir(parents=True, exist_ok=True)
+    if compress_level is None:
+        img.save(out_path)
+    else:
+        img.save(out_path, compress_level=compress_level)
+
+
+def _check_rgb_size(rgb_bytes, w: int, h: int) -> None:
+    n = memoryview(rgb_bytes).nbytes
+    if n != w * h * 3:
         raise ValueError(
-            f"Размер данных {len(rgb_bytes)} не совпадает с {w*h*3} (w={w}, h={h})"
+            f"Размер данных {n} не совпадает с {w*h*3} (w={w}, h={h})"
         )
-    img = Image.frombytes("RGB", (w, h), rgb_bytes)
+
+
+# Формат .rgb: заголовок RAW_MAGIC + ширина и высота (uint32 LE), затем
+# пиксели RGB построчно без сжатия
+RAW_MAGIC = b"RGB8"
+RAW_HEADER = struct.Struct("<4sII")
+
+# Расширения файлов для форматов сохранения шифртекста
+IMAGE_FORMATS = {"png": ".png", "raw": ".rgb", "npy": ".npy"}
+MAPPED_SUFFIXES = (".rgb", ".npy")
+
+
+def save_image_raw(rgb_bytes, w: int, h: int, out_path: str):
+    _check_rgb_size(rgb_bytes, w, h)
     Path(out_path).parent.mkdir(parents=True, exist_ok=True)
-    img.save(out_path)
+    with open(out_path, "wb") as f:
+        f.write(RAW_HEADER.pack(RAW_MAGIC, w, h))
+        f.write(memoryview(rgb_bytes).cast("B"))
+
+
+def save_image_npy(rgb_bytes, w: int, h: int, out_path: str):
+    _check_rgb_size(rgb_bytes, w, h)
+    Path(out_path).parent.mkdir(parents=True, exist_ok=True)
+    np.save(out_path, np.frombuffer(rgb_bytes, dtype=np.uint8).reshape(h, w, 3))
+
+
+def save_image(rgb_bytes, w: int, h: int, out_path: str, fmt: str = "png", compress_level: int | None = None):
+    """Сохранить RGB-буфер в формате fmt (см. IMAGE_FORMATS)."""
+    if fmt == "png":
+        save_image_rgb(rgb_bytes, w, h, out_path, compress_level)
+    elif fmt == "raw":
+        save_image_raw(rgb_bytes, w, h, out_path)
+    elif fmt == "npy":
+        save_image_npy(rgb_bytes, w, h, out_path)
+    else:
+        raise ValueError(f"Unknown image format: {fmt}")
 
 
 # ================== Метаданные и хэш ==================
@@ -38,6 +127,7 @@ def write_meta(
     input_path: str,
     output_path: str,
     nonce_or_iv: bytes | None,
+    tag: bytes | None = None,
 ):
     meta = {
         "algo": algo,
@@ -47,6 +137,8 @@ def write_meta(
         "input": input_path,
         "output": output_path,
     }
+    if tag is not None:
+        meta["tag"] = tag.hex()
     Path(meta_path).parent.mkdir(parents=True, exist_ok=True)
     Path(meta_path).write_text(json.dumps(meta, indent=2, ensure_ascii=False), encoding="utf-8")
 
@@ -59,24 +151,18 @@ def write_metrics_json(path: str, obj: dict):
 
 # ================== Гистограммы ==================
 
-def histogram_png(rgb_bytes: bytes, w: int, h: int, out_path: str, title: str):
-    if len(rgb_bytes) != w * h * 3:
+def histogram_png(rgb_bytes: bytes, w: int, h: int, out_path: str, title: str, hists=None):
+    # hists - уже посчитанные гистограммы каналов (например, из analyze_image):
+    # {"R": [...], "G": [...], "B": [...]} или массив (3, 256)
+    if memoryview(rgb_bytes).nbytes != w * h * 3:
         raise ValueError("Размер данных не совпадает с w*h*3")
 
     # Подсчёт частот
-    n = w * h
-    r_hist = [0] * 256
-    g_hist = [0] * 256
-    b_hist = [0] * 256
-
-    it = iter(rgb_bytes)
-    for _ in range(n):
-        r = next(it)
-        g = next(it)
-        b = next(it)
-        r_hist[r] += 1
-        g_hist[g] += 1
-        b_hist[b] += 1
+    if hists is None:
+        hists = channel_histograms(rgb_bytes)
+    if isinstance(hists, dict):
+        hists = [hists["R"], hists["G"], hists["B"]]
+    r_hist, g_hist, b_hist = (list(hh) for hh in hists)
 
     # Параметры панели
     panel_w, panel_h = 256, 100
@@ -114,3 +200,44 @@ def histogram_png(rgb_bytes: bytes, w: int, h: int, out_path: str, title: str):
 
     Path(out_path).parent.mkdir(parents=True, exist_ok=True)
     img.save(out_path)
+
+
+# ================== Диаграмма рассеяния пар пикселей ==================
+
+def scatter_png(xs, ys, out_path: str, title: str):
+    # xs, ys - яркости пар соседних пикселей (0..255), например из
+    # corr_adjacent_sampled(); ось X - пиксель, ось Y - его сосед
+    header_h = 20
+    size = 256
+    img = Image.new("RGB", (size, header_h + size), (255, 255, 255))
+    draw = ImageDraw.Draw(img)
+    draw.text((5, 2), title, fill=(0, 0, 0))
+    for x, y in zip(xs, ys):
+        img.putpixel((int(x), header_h + size - 1 - int(y)), (0, 0, 200))
+    Path(out_path).parent.mkdir(parents=True, exist_ok=True)
+    img.save(out_path)
+
+
+# ================== Тепловая карта локальной энтропии ==================
+
+def entropy_heatmap_png(tile_map, out_path: str, title: str, max_bits: float = 8.0):
+    # tile_map - массив (3, ny, nx) из local_entropy_maps(); рисуем среднее
+    # по каналам: синий - 0 бит, зелёный - середина, красный - max_bits
+    mean_map = np.asarray(tile_map).mean(axis=0)
+    ny, nx = mean_map.shape
+    header_h = 20
+    scale = max(1, 512 // max(nx, ny, 1))
+
+    t = np.clip(mean_map / max_bits, 0.0, 1.0)
+    rgb = np.stack([t, 1.0 - np.abs(2.0 * t - 1.0), 1.0 - t], axis=-1)
+    rgb = (rgb * 255.0 + 0.5).astype(np.uint8)
+    rgb = np.repeat(np.repeat(rgb, scale, axis=0), scale, axis=1)
+
+    w = max(nx * scale, 256)
+    img = Image.new("RGB", (w, header_h + ny * scale), (255, 255, 255))
+    if rgb.size:
+        heat = np.ascontiguousarray(rgb)
+        img.paste(Image.frombuffer("RGB", (nx * scale, ny * scale), heat, "raw", "RGB", 0, 1), (0, header_h))
+    ImageDraw.Draw(img).text((5, 2), title, fill=(0, 0, 0))
+    Path(out_path).parent.mkdir(parents=True, exist_ok=True)
+    img.save(out_path)
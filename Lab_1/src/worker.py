@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import signal
+import stat
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import replace
+
+from backends import BACKENDS
+from pipeline import RunOptions, job_option_fields, normalize_key, resolve_input, run_image_job
+
+
+# ========== Резидентный режим: очередь задач JSONL ==========
+# main.py --serve поднимает пул процессов один раз и читает задачи по одной
+# JSON-строке из stdin или из Unix-сокета (--socket). Запуск интерпретатора,
+# импорт PIL/pycryptodome и прогрев кэшей (ключевые потоки, контексты AES)
+# оплачиваются один раз на процесс пула, а не на каждое изображение.
+# На каждую задачу - одна строка-результат в порядке завершения, сопоставлять
+# по "id".
+#
+# Задача:
+#   {"id": "a1", "input": "imgs/a.png", "algo": "aes-gcm" | ["xor", ...] | "all",
+#    "key": "..." | "key_file": "path" | "key_env": "NAME",
+#    "options": {"verify": "hash", "image_format": "raw", ...}}
+# Результат:
+#   {"id": "a1", "ok": true, "results": [summary, ...], "errors": [...],
+#    "seconds": 1.23, "cache": {"hits": 0, "misses": 1}}
+# Поля одни и те же у каждой строки; у непринятой задачи seconds - null.
+#
+# Файлы пишутся как обычно - в imgs/ и results/ рабочего каталога; пути
+# есть в каждом summary ("output", "hist_src", ...).
+
+# Поля RunOptions, которые задача может переопределить в "options"
+JOB_OPTIONS = job_option_fields()
+
+
+class JobError(ValueError):
+    """Некорректная строка задачи: отвечаем ошибкой, сервер работает дальше."""
+
+
+def _job_key(spec: dict, default_key: bytes) -> bytes:
+    refs = [name for name in ("key", "key_file", "key_env") if name in spec]
+    if len(refs) > 1:
+        raise JobError(f"указано несколько ключей: {', '.join(refs)}")
+    if not refs:
+        return default_key
+    ref = refs[0]
+    value = spec[ref]
+    if not isinstance(value, str):
+        raise JobError(f"{ref}: ожидается строка")
+    if ref == "key":
+        return normalize_key(value)
+    if ref == "key_env":
+        if value not in os.environ:
+            raise JobError(f"key_env: переменная {value} не задана")
+        return normalize_key(os.environ[value])
+    try:
+        with open(value, encoding="utf-8") as f:
+            return normalize_key(f.read().rstrip("\r\n"))
+    except OSError as exc:
+        raise JobError(f"key_file: {exc}") from None
+
+
+def _job_options(spec: dict, base: RunOptions) -> RunOptions:
+    overrides = spec.get("options") or {}
+    if not isinstance(overrides, dict):
+        raise JobError("options: ожидается объект")
+    unknown = sorted(set(overrides) - JOB_OPTIONS)
+    if unknown:
+        raise JobError(f"options: неизвестные поля {', '.join(unknown)}")
+    if "local_entropy_tiles" in overrides:
+        overrides = {**overrides, "local_entropy_tiles": tuple(overrides["local_entropy_tiles"])}
+    return replace(base, **overrides)
+
+
+def parse_job(spec: dict, default_key: bytes, base: RunOptions) -> tuple[str, list, bytes, RunOptions]:
+    """Разобранная задача -> (путь к изображению, шифры, ключ, параметры)."""
+    input_path = spec.get("input")
+    if not isinstance(input_path, str) or not input_path:
+        raise JobError("input: ожидается путь к изображению")
+    algo = spec.get("algo")
+    if algo == "all":
+        algos = list(BACKENDS)
+    elif isinstance(algo, str):
+        algos = [algo]
+    elif isinstance(algo, list) and algo and all(isinstance(a, str) for a in algo):
+        algos = algo
+    else:
+        raise JobError("algo: ожидается имя шифра, список имён или \"all\"")
+    unknown = [a for a in algos if a not in BACKENDS]
+    if unknown:
+        raise JobError(f"algo: неизвестные шифры {', '.join(unknown)}")
+    return resolve_input(input_path), algos, _job_key(spec, default_key), _job_options(spec, base)
+
+
+def _serve_init() -> None:
+    # Сообщения конвейера ([OK] ...) не должны попадать в поток результатов
+    sys.stdout = sys.stderr
+
+
+def _serve_job(input_path: str, algos: list, key: bytes, opts: RunOptions, write_workers: int):
+    t0 = time.perf_counter()
+    rows, errors, cache_counts = run_image_job(input_path, algos, key, opts, write_workers)
+    return rows, errors, cache_counts, time.perf_counter() - t0
+
+
+def _result(job_id, rows: list, errors: list, seconds: float | None = None, hits: int = 0, misses: int = 0) -> dict:
+    # Одинаковый набор полей в каждой строке, в том числе для битых задач
+    return {
+        "id": job_id,
+        "ok": not errors,
+        "results": rows,
+        "errors": errors,
+        "seconds": seconds,
+        "cache": {"hits": hits, "misses": misses},
+    }
+
+
+class JobServer:
+    """Пул процессов + разбор задач; общий для stdin и всех клиентов сокета.
+
+    Одновременно в работе не больше max_pending задач: дальше чтение
+    входа приостанавливается, и очередь копится у отправителя.
+    """
+
+    def __init__(
+        self,
+        opts: RunOptions,
+        key: bytes,
+        jobs: int = 1,
+        write_workers: int = 2,
+        max_pending: int | None = None,
+    ) -> None:
+        # В процессы писатель файлов не передаётся - у каждого свой
+        self.opts = replace(opts, writer=None)
+        self.key = key
+        self.jobs = max(1, jobs)
+        self.write_workers = write_workers
+        self.max_pending = max_pending or 2 * self.jobs
+        self.done = 0
+        self.failed = 0
+        self._pool: ProcessPoolExecutor | None = None
+        self._slots: asyncio.Semaphore | None = None
+
+    def __enter__(self) -> "JobServer":
+        self._pool = ProcessPoolExecutor(max_workers=self.jobs, initializer=_serve_init)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._pool.shutdown(wait=True)
+
+    async def handle(self, readline, emit) -> None:
+        """Читать задачи через readline() до EOF, отвечать через emit(dict)."""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_pending)
+        tasks: set = set()
+        seq = 0
+        while True:
+            line = await readline()
+            if not line:
+                break
+            line = line.strip()
+            if not line:
+                continue
+            seq += 1
+            await self._slots.acquire()
+            task = asyncio.create_task(self._run(line, seq, emit))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+
+    async def _run(self, line, seq: int, emit) -> None:
+        try:
+            result = await self._execute(line, seq)
+            self.done += 1
+            if not result["ok"]:
+                self.failed += 1
+            await emit(result)
+        finally:
+            self._slots.release()
+
+    async def _execute(self, line, seq: int) -> dict:
+        job_id = seq
+        try:
+            spec = json.loads(line)
+            if not isinstance(spec, dict):
+                raise JobError("задача должна быть JSON-объектом")
+            job_id = spec.get("id", seq)
+            input_path, algos, key, opts = parse_job(spec, self.key, self.opts)
+        except (ValueError, TypeError) as exc:  # JSONDecodeError, JobError, replace()
+            return _result(job_id, [], [{"input": None, "algo": None, "error": str(exc)}])
+
+        loop = asyncio.get_running_loop()
+        pool = self._pool
+        try:
+            rows, errors, (hits, misses), seconds = await loop.run_in_executor(
+                pool, _serve_job, input_path, algos, key, opts, self.write_workers,
+            )
+        except BrokenProcessPool as exc:
+            # Процесс пула упал: задача проваливается, пул пересоздаётся
+            # (один раз, даже если упавший пул вернул ошибку нескольким задачам)
+            if pool is self._pool:
+                self._restart_pool()
+            return _result(job_id, [], [{"input": input_path, "algo": None, "error": repr(exc)}])
+        except Exception as exc:
+            return _result(job_id, [], [{"input": input_path, "algo": None, "error": repr(exc)}])
+        return _result(job_id, rows, errors, seconds, hits, misses)
+
+    def _restart_pool(self) -> None:
+        old = self._pool
+        self._pool = ProcessPoolExecutor(max_workers=self.jobs, initializer=_serve_init)
+        old.shutdown(wait=False)
+
+
+def _dump_line(msg: dict) -> bytes:
+    return (json.dumps(msg) + "\n").encode("utf-8")
+
+
+async def _serve_stdin(server: JobServer) -> None:
+    loop = asyncio.get_running_loop()
+    stdin, stdout = sys.stdin.buffer, sys.stdout.buffer
+
+    async def readline():
+        # Блокирующее чтение в потоке: работает и с каналом, и с файлом
+        return await loop.run_in_executor(None, stdin.readline)
+
+    async def emit(msg: dict) -> None:
+        stdout.write(_dump_line(msg))
+        stdout.flush()
+
+    await server.handle(readline, emit)
+
+
+async def _serve_socket(server: JobServer, path: str) -> None:
+    async def on_client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        async def emit(msg: dict) -> None:
+            writer.write(_dump_line(msg))
+            await writer.drain()
+
+        try:
+            await server.handle(reader.readline, emit)
+        except (ConnectionError, asyncio.LimitOverrunError, ValueError) as exc:
+            print(f"[serve] клиент отключён: {exc!r}", file=sys.stderr)
+        finally:
+            writer.close()
+
+    try:
+        mode = os.stat(path).st_mode
+    except FileNotFoundError:
+        pass
+    else:
+        # Удаляем только сокет от прошлого запуска, чужой файл не трогаем
+        if not stat.S_ISSOCK(mode):
+            raise SystemExit(f"[serve] {path}: существует и не является сокетом")
+        os.unlink(path)
+    srv = await asyncio.start_unix_server(on_client, path)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    print(f"[serve] listening on {path}", file=sys.stderr)
+    try:
+        async with srv:
+            await stop.wait()
+    finally:
+        os.unlink(path)
+
+
+def serve(
+    opts: RunOptions,
+    key: bytes,
+    jobs: int = 1,
+    write_workers: int = 2,
+    socket_path: str | None = None,
+) -> JobServer:
+    """Резидентный режим: задачи из stdin (до EOF) или из Unix-сокета (до SIGINT/SIGTERM)."""
+    with JobServer(opts, key, jobs, write_workers) as server:
+        if socket_path:
+            asyncio.run(_serve_socket(server, socket_path))
+        else:
+            asyncio.run(_serve_stdin(server))
+    print(f"[serve] {server.done} задач(и), с ошибкой: {server.failed}", file=sys.stderr)
+    return server
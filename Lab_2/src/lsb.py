@@ -4,7 +4,7 @@ from __future__ import annotations
 from pathlib import Path
 from typing import Tuple
 
-from PIL import Image
+from utils import load_image, save_image_rgb
 
 
 
@@ -122,7 +122,8 @@ def _parse_payload_bits(bits: list[int]) -> bytes:
 
 
 
-# Вставка/извлечение в png
+# Вставка/извлечение: контейнер - png или сырой .rgb/.npy (utils.load_image),
+# stego-изображение сохраняется через PIL по расширению stego_path
 def lsb_encode_image(
     cover_path: str | Path,
     stego_path: str | Path,
@@ -133,9 +134,7 @@ def lsb_encode_image(
     cover_path = Path(cover_path)
     stego_path = Path(stego_path)
 
-    img = Image.open(cover_path).convert("RGB")
-    w, h = img.size
-    rgb = img.tobytes()
+    rgb, w, h = load_image(cover_path)
     capacity_bits = _capacity_bits_rgb(w, h, bits_per_channel)
     all_payload_bits = _build_payload_bits(message)
 
@@ -171,8 +170,7 @@ def lsb_encode_image(
         message_bits=all_payload_bits,
         bits_per_channel=bits_per_channel,
     )
-    stego_img = Image.frombytes("RGB", (w, h), stego_rgb)
-    stego_img.save(stego_path)
+    save_image_rgb(stego_rgb, w, h, stego_path)
 
 
 # Извлечение сообщения из stego-изображения
@@ -181,9 +179,7 @@ def lsb_decode_image(
     bits_per_channel: int = 1,
 ) -> bytes:
     stego_path = Path(stego_path)
-    img = Image.open(stego_path).convert("RGB")
-    w, h = img.size
-    rgb = img.tobytes()
+    rgb, w, h = load_image(stego_path)
 
     header_bits = _extract_bits_lsb_rgb(
         rgb_bytes=rgb,
@@ -55,16 +55,18 @@ def run_encode(args: argparse.Namespace) -> None:
 
     psnr_val = psnr_rgb(cover_rgb, stego_rgb)
     ssim_val = ssim_rgb(cover_rgb, stego_rgb, w, h)
-    chi2_info_cover = hi2_lsb_all_channels(cover_rgb)
-    chi2_info_stego = hi2_lsb_all_channels(stego_rgb)
+    hists_cover = channel_histograms(cover_rgb)
+    hists_stego = channel_histograms(stego_rgb)
+    chi2_info_cover = hi2_lsb_all_channels(cover_rgb, hists_cover)
+    chi2_info_stego = hi2_lsb_all_channels(stego_rgb, hists_stego)
 
     stem = cover_path.stem
     hist_cover_path = Path("results") / f"{stem}_hist_cover.png"
     hist_stego_path = Path("results") / f"{stem}_hist_stego.png"
     diff_map_path = Path("results") / f"{stem}_diff_map.png"
 
-    histogram_png(cover_rgb, w, h, hist_cover_path, f"{stem} cover")
-    histogram_png(stego_rgb, w, h, hist_stego_path, f"{stem} stego")
+    histogram_png(cover_rgb, w, h, hist_cover_path, f"{stem} cover", hists_cover)
+    histogram_png(stego_rgb, w, h, hist_stego_path, f"{stem} stego", hists_stego)
     diff_map_png(cover_rgb, stego_rgb, w, h, diff_map_path)
 
     summary = {
@@ -112,9 +114,9 @@ def run_experiment(args: argparse.Namespace) -> None:
     if not imgs_dir.exists():
         raise SystemExit(f"Images dir not found: {imgs_dir}")
 
-    covers: List[Path] = sorted(imgs_dir.glob("*.png"))
+    covers: List[Path] = sorted(p for p in imgs_dir.iterdir() if p.suffix.lower() in COVER_SUFFIXES)
     if not covers:
-        raise SystemExit(f"No PNG images found in {imgs_dir}")
+        raise SystemExit(f"No cover images (.png, .rgb, .npy) found in {imgs_dir}")
 
     bits_per_channel = args.bits
     payload_percents = [0.1, 0.5, 1.0, 5.0]
@@ -124,6 +126,8 @@ def run_experiment(args: argparse.Namespace) -> None:
     for cover_path in covers:
         cover_rgb, w, h = load_image(cover_path)
         capacity_bits = w * h * 3 * bits_per_channel
+        # Ковер один на все уровни нагрузки - его хи-квадрат считается один раз
+        chi2_cover = hi2_lsb_all_channels(cover_rgb)
 
         for p in payload_percents:
             payload_frac = p / 100.0
@@ -156,7 +160,6 @@ def run_experiment(args: argparse.Namespace) -> None:
 
             psnr_val = psnr_rgb(cover_rgb, stego_rgb)
             ssim_val = ssim_rgb(cover_rgb, stego_rgb, w, h)
-            chi2_cover = hi2_lsb_all_channels(cover_rgb)
             chi2_stego = hi2_lsb_all_channels(stego_rgb)
 
             row = {
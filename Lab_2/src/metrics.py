@@ -3,6 +3,8 @@ from __future__ import annotations
 
 import math
 from typing import Tuple
+
+import numpy as np
 from scipy import stats
 
 def _rgb_to_gray_list(rgb_bytes: bytes, width: int, height: int) -> list[float]:
@@ -82,19 +84,23 @@ def ssim_rgb(cover: bytes, stego: bytes, width: int, height: int) -> float:
     return ssim_gray_from_lists(gray_cov, gray_stego)
 
 
+# Гистограммы каналов (общие для хи-квадрат и histogram_png): считаются
+# один раз вызывающим и передаются через hists=, без глобального кэша
+def channel_histograms(rgb_bytes) -> np.ndarray:
+    """Гистограммы R, G, B: массив (3, 256) int64."""
+    px = np.frombuffer(rgb_bytes, dtype=np.uint8)
+    n_pixels = px.size // 3
+    px = px[:n_pixels * 3].reshape(-1, 3)
+    return np.stack([np.bincount(px[:, c], minlength=256) for c in range(3)])
+
+
 # хи_квадрат тест по LSB (пары 2k, 2k+1)
-def _channel_histogram(rgb_bytes: bytes, channel: int) -> list[int]:
+def hi2_lsb_channel(rgb_bytes: bytes, channel: int, hists: np.ndarray | None = None) -> Tuple[float, int]:
     if channel not in (0, 1, 2):
         raise ValueError("channel must be 0 (R), 1 (G) or 2 (B)")
-    n_pixels = len(rgb_bytes) // 3
-    hist = [0] * 256
-    base = channel
-    for i in range(n_pixels):
-        v = rgb_bytes[3 * i + base]
-        hist[v] += 1
-    return hist
-def hi2_lsb_channel(rgb_bytes: bytes, channel: int) -> Tuple[float, int]:
-    hist = _channel_histogram(rgb_bytes, channel)
+    if hists is None:
+        hists = channel_histograms(rgb_bytes)
+    hist = hists[channel].tolist()
     chi2 = 0.0
     used_pairs = 0
 
@@ -110,10 +116,12 @@ def hi2_lsb_channel(rgb_bytes: bytes, channel: int) -> Tuple[float, int]:
 
     df = max(used_pairs - 1, 1)
     return chi2, df
-def hi2_lsb_all_channels(rgb_bytes: bytes) -> dict:
+def hi2_lsb_all_channels(rgb_bytes: bytes, hists: np.ndarray | None = None) -> dict:
+    if hists is None:
+        hists = channel_histograms(rgb_bytes)
     result = {}
     for ch, name in enumerate(("R", "G", "B")):
-        chi2, df = hi2_lsb_channel(rgb_bytes, ch)
+        chi2, df = hi2_lsb_channel(rgb_bytes, ch, hists)
         p_value = 1 - stats.chi2.cdf(chi2, df)
         result[name] = {"chi2": chi2, "df": df, "p_value": p_value}
     return result
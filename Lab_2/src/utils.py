@@ -1,19 +1,59 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
 
+import struct
 from pathlib import Path
 from typing import Tuple
 
+import numpy as np
 from PIL import Image, ImageDraw
 
+from metrics import channel_histograms
+
+
+# Сырые изображения: .rgb (заголовок RAW_HEADER + пиксели RGB) или .npy (h, w, 3) uint8
+RAW_MAGIC = b"RGB8"
+RAW_HEADER = struct.Struct("<4sII")
+RAW_SUFFIXES = (".rgb", ".npy")
+COVER_SUFFIXES = (".png",) + RAW_SUFFIXES
+
 
 def load_image(path: str | Path) -> tuple[bytes, int, int]:
     path = Path(path)
+    if path.suffix.lower() in RAW_SUFFIXES:
+        return load_image_mapped(path)
     img = Image.open(path).convert("RGB")
     w, h = img.size
     return img.tobytes(), w, h
 
 
+def load_image_mapped(path: str | Path) -> tuple[memoryview, int, int]:
+    # Пиксели не копируются: буфер только для чтения отображён из файла
+    path = Path(path)
+    with open(path, "rb") as f:
+        if path.suffix.lower() == ".rgb":
+            magic, w, h = RAW_HEADER.unpack(f.read(RAW_HEADER.size))
+            if magic != RAW_MAGIC:
+                raise ValueError(f"{path}: not a raw RGB file")
+        else:
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            if dtype != np.uint8 or len(shape) != 3 or shape[2] != 3 or fortran_order:
+                raise ValueError(f"{path}: expected C-ordered uint8 array (h, w, 3)")
+            h, w = shape[0], shape[1]
+        offset = f.tell()
+
+    n = w * h * 3
+    if path.stat().st_size - offset < n:
+        raise ValueError(f"{path}: file truncated")
+    if n == 0:
+        return memoryview(b""), w, h
+    return memoryview(np.memmap(path, dtype=np.uint8, mode="r", offset=offset, shape=(n,))), w, h
+
+
 def save_image_rgb(rgb_bytes: bytes, width: int, height: int, out_path: str | Path) -> None:
     out_path = Path(out_path)
     img = Image.frombytes("RGB", (width, height), rgb_bytes)
@@ -26,22 +66,16 @@ def histogram_png(
     height: int,
     out_path: str | Path,
     title: str = "",
+    hists=None,
 ) -> None:
+    # hists - уже посчитанные channel_histograms(rgb_bytes), чтобы не считать заново
     out_path = Path(out_path)
 
-    n_pixels = width * height
-    r_hist = [0] * 256
-    g_hist = [0] * 256
-    b_hist = [0] * 256
-
-    it = iter(rgb_bytes)
-    for _ in range(n_pixels):
-        r = next(it)
-        g = next(it)
-        b = next(it)
-        r_hist[r] += 1
-        g_hist[g] += 1
-        b_hist[b] += 1
+    if len(rgb_bytes) != width * height * 3:
+        raise ValueError("histogram: size does not match width*height*3")
+    if hists is None:
+        hists = channel_histograms(rgb_bytes)
+    r_hist, g_hist, b_hist = (hh.tolist() for hh in hists)
 
     panel_w, panel_h = 256, 100
     gap = 10